@@ -3,13 +3,42 @@ from django.conf import settings
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 
+from api.counters import delete_with_counters
 from api.models import (Cart, Favorite, Ingredient, IngredientInRecipe, Recipe,
                         Tag)
 from users.models import Follow, User
+from utils.pagination import CountingPaginator
 
 admin.site.empty_value_display = 'Не задано'
 
 
+class LargeTableAdmin(admin.ModelAdmin):
+    '''
+    Базовый класс админки для больших таблиц.
+
+    Количество объектов считается CountingPaginator, а общее количество
+    без фильтров не запрашивается отдельным COUNT.
+    '''
+
+    paginator = CountingPaginator
+    show_full_result_count = False
+
+
+class CountersAdmin(LargeTableAdmin):
+    '''
+    Админка моделей, от которых зависят счётчики.
+
+    При удалении счётчики уменьшаются одним запросом
+    на каждый связанный объект.
+    '''
+
+    def delete_model(self, request, obj):
+        delete_with_counters(self.model.objects.filter(pk=obj.pk))
+
+    def delete_queryset(self, request, queryset):
+        delete_with_counters(queryset)
+
+
 @admin.register(Tag)
 class TagAdmin(admin.ModelAdmin):
     list_display = ('id', 'name', 'slug', 'color')
@@ -23,7 +52,7 @@ class IngredientAdmin(admin.ModelAdmin):
     list_display = ('id', 'name', 'measurement_unit')
     list_display_links = ('name',)
     search_fields = ('name',)
-    list_filter = ('name',)
+    list_filter = ('measurement_unit',)
 
 
 class TagInLine(admin.TabularInline):
@@ -34,18 +63,30 @@ class IngredientInLine(admin.TabularInline):
     model = IngredientInRecipe
     min_num = settings.MIN_INGREDIENT
     fields = ('ingredient', 'amount')
+    autocomplete_fields = ('ingredient',)
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('ingredient')
 
 
 @admin.register(Recipe)
-class RecipeAdmin(admin.ModelAdmin):
+class RecipeAdmin(CountersAdmin):
     inlines = [TagInLine, IngredientInLine]
     list_display = (
         'id', 'name', 'text', 'author', 'tags_display',
-        'ingredients_display', 'pub_date', 'image', 'cooking_time'
+        'ingredients_display', 'pub_date', 'image', 'cooking_time',
+        'favorites_count', 'carts_count'
     )
     list_display_links = ('name',)
     search_fields = ('name',)
-    list_filter = ('name', 'author', 'tags')
+    list_filter = ('tags',)
+    autocomplete_fields = ('author',)
+    readonly_fields = ('favorites_count', 'carts_count')
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).defer(
+            'search_vector', 'ingredient_ids'
+        ).prefetch_related('tags', 'ingredients')
 
     @admin.display(description='Тэги')
     def tags_display(self, obj):
@@ -57,31 +98,40 @@ class RecipeAdmin(admin.ModelAdmin):
             [ingredient.name for ingredient in obj.ingredients.all()]
         )
 
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        Recipe.objects.filter(id=form.instance.id).update_search_fields()
+
 
 @admin.register(Favorite)
-class FavoriteAdmin(admin.ModelAdmin):
+class FavoriteAdmin(CountersAdmin):
     list_display = ('recipe', 'author')
-    list_filter = ('recipe', 'author')
+    list_select_related = ('recipe', 'author')
+    search_fields = ('author__username',)
+    autocomplete_fields = ('recipe', 'author')
 
 
 @admin.register(Cart)
-class CartAdmin(admin.ModelAdmin):
+class CartAdmin(CountersAdmin):
     list_display = ('recipe', 'author')
-    list_filter = ('recipe', 'author')
+    list_select_related = ('recipe', 'author')
+    search_fields = ('author__username',)
+    autocomplete_fields = ('recipe', 'author')
 
 
 @admin.register(User)
-class UserAdmin(BaseUserAdmin):
+class UserAdmin(BaseUserAdmin, LargeTableAdmin):
     list_display = (
         'id', 'email', 'username', 'first_name',
-        'last_name',
+        'last_name', 'recipes_count', 'followers_count'
     )
-    search_fields = ('username',)
-    list_filter = ('username', 'email')
+    search_fields = ('username', 'email')
+    list_filter = ('is_staff', 'is_active')
 
 
 @admin.register(Follow)
-class FollowAdmin(admin.ModelAdmin):
+class FollowAdmin(CountersAdmin):
     list_display = ('user', 'following')
-    list_filter = ('user', 'following')
+    list_select_related = ('user', 'following')
     search_fields = ('user__username', 'following__username')
+    autocomplete_fields = ('user', 'following')
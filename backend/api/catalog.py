@@ -0,0 +1,130 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.utils.cache import patch_cache_control
+from rest_framework import status
+from rest_framework.response import Response
+
+from api.models import Tag
+
+TAGS = 'tags'
+INGREDIENTS = 'ingredients'
+
+_local_cache = OrderedDict()
+_local_cache_lock = threading.Lock()
+
+
+def get_shared_cache():
+    '''Возвращает кэш, общий для всех процессов приложения.'''
+    return caches[settings.CATALOG_CACHE_ALIAS]
+
+
+def get_version_key(catalog):
+    return f'catalog-version:{catalog}'
+
+
+def get_version_timeout(cache):
+    '''
+    Возвращает время жизни версии справочника в кэше.
+
+    Кэш в памяти процесса не общий: увеличение версии в одном воркере
+    не видно остальным. Поэтому в таком кэше версия живёт
+    CATALOG_LOCAL_VERSION_TIMEOUT секунд, после чего каждый процесс
+    берёт новую версию и перечитывает справочник из базы.
+    '''
+    if isinstance(cache, LocMemCache):
+        return settings.CATALOG_LOCAL_VERSION_TIMEOUT
+    return None
+
+
+def add_catalog_version(cache, key):
+    '''
+    Создаёт версию справочника, если её нет в кэше.
+
+    Начальная версия берётся из текущего времени, чтобы после вытеснения
+    счётчика из кэша она не совпала с версией, уже сохранённой в памяти.
+    '''
+    cache.add(key, int(time.time() * 1000), get_version_timeout(cache))
+
+
+def get_catalog_version(catalog):
+    '''Возвращает текущую версию справочника.'''
+    cache = get_shared_cache()
+    key = get_version_key(catalog)
+    version = cache.get(key)
+    if version is None:
+        add_catalog_version(cache, key)
+        version = cache.get(key)
+    return version
+
+
+def bump_catalog_version(catalog):
+    '''Инвалидирует все закэшированные данные справочника.'''
+    cache = get_shared_cache()
+    key = get_version_key(catalog)
+    try:
+        cache.incr(key)
+    except ValueError:
+        add_catalog_version(cache, key)
+
+
+def get_key_hash(key):
+    return hashlib.md5(key.encode()).hexdigest()
+
+
+def get_catalog_data(catalog, key, build):
+    '''
+    Возвращает версию справочника и данные по ключу key.
+
+    Данные ищутся в памяти процесса, затем в общем кэше и только потом
+    строятся функцией build. Устаревшие записи отбрасываются по версии.
+    '''
+    version = get_catalog_version(catalog)
+    local_key = (catalog, key)
+    with _local_cache_lock:
+        cached = _local_cache.get(local_key)
+        if cached is not None and cached[0] == version:
+            _local_cache.move_to_end(local_key)
+            return version, cached[1]
+    cache = get_shared_cache()
+    shared_key = f'catalog:{catalog}:{version}:{get_key_hash(key)}'
+    data = cache.get(shared_key)
+    if data is None:
+        data = build()
+        cache.set(shared_key, data, settings.CATALOG_CACHE_TIMEOUT)
+    with _local_cache_lock:
+        _local_cache[local_key] = (version, data)
+        _local_cache.move_to_end(local_key)
+        while len(_local_cache) > settings.CATALOG_LOCAL_CACHE_SIZE:
+            _local_cache.popitem(last=False)
+    return version, data
+
+
+def get_tag_ids():
+    '''Возвращает словарь id тэгов по их слагам.'''
+    return get_catalog_data(
+        TAGS, 'slug-ids', lambda: dict(Tag.objects.values_list('slug', 'id'))
+    )[1]
+
+
+def catalog_response(request, catalog, key, build):
+    '''
+    Возвращает ответ с данными справочника и заголовком ETag.
+
+    Если клиент прислал If-None-Match с актуальным ETag,
+    возвращается 304 Not Modified без тела ответа.
+    '''
+    version, data = get_catalog_data(catalog, key, build)
+    etag = f'"{catalog}-{version}-{get_key_hash(key)}"'
+    if etag in request.META.get('HTTP_IF_NONE_MATCH', ''):
+        response = Response(status=status.HTTP_304_NOT_MODIFIED)
+    else:
+        response = Response(data)
+    response['ETag'] = etag
+    patch_cache_control(response, no_cache=True)
+    return response
@@ -0,0 +1,99 @@
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+from api.models import Cart, Favorite, Recipe
+from users.models import Follow, User
+
+# Счётчик: (модель, поле счётчика, связанная модель, поле связи).
+COUNTERS = (
+    (Recipe, 'favorites_count', Favorite, 'recipe'),
+    (Recipe, 'carts_count', Cart, 'recipe'),
+    (User, 'recipes_count', Recipe, 'author'),
+    (User, 'followers_count', Follow, 'following'),
+)
+
+
+def change_counter(model, pk, field, delta):
+    '''
+    Атомарно изменяет счётчик объекта на delta одним запросом UPDATE.
+
+    Значение счётчика не опускается ниже нуля.
+    '''
+    model.objects.filter(pk=pk).update(
+        **{field: Greatest(F(field) + delta, 0)}
+    )
+
+
+@transaction.atomic
+def delete_with_counters(queryset):
+    '''
+    Удаляет строки queryset и уменьшает зависящие от них счётчики.
+
+    Строки группируются по связанному объекту, и счётчик каждого
+    объекта уменьшается одним запросом UPDATE на всю группу.
+    Возвращает количество удалённых строк.
+    '''
+    counts = [
+        (model, field, list(
+            queryset.order_by().values(related_field).annotate(
+                count=Count('pk')
+            ).values_list(related_field, 'count')
+        ))
+        for model, field, related_model, related_field in COUNTERS
+        if related_model is queryset.model
+    ]
+    deleted, _ = queryset.delete()
+    for model, field, related_counts in counts:
+        for pk, count in related_counts:
+            change_counter(model, pk, field, -count)
+    return deleted
+
+
+def get_actual_count(related_model, related_field):
+    '''Возвращает подзапрос с фактическим количеством связанных строк.'''
+    return Coalesce(
+        Subquery(
+            related_model.objects.filter(
+                **{related_field: OuterRef('pk')}
+            ).order_by().values(related_field).annotate(
+                count=Count('pk')
+            ).values('count')
+        ),
+        0
+    )
+
+
+def get_counter_drift():
+    '''
+    Возвращает расхождения счётчиков с фактическими данными.
+
+    Каждое расхождение - кортеж (модель, поле, id объекта,
+    сохранённое значение, фактическое значение).
+    '''
+    drift = []
+    for model, field, related_model, related_field in COUNTERS:
+        objects = model.objects.annotate(
+            actual=get_actual_count(related_model, related_field)
+        ).exclude(**{field: F('actual')}).values_list('pk', field, 'actual')
+        drift.extend(
+            (model, field, pk, value, actual)
+            for pk, value, actual in objects.iterator()
+        )
+    return drift
+
+
+def reconcile_counters():
+    '''
+    Пересчитывает все счётчики по фактическим данным.
+
+    Изменяются только строки с расхождениями.
+    Возвращает количество исправленных строк.
+    '''
+    updated = 0
+    for model, field, related_model, related_field in COUNTERS:
+        actual = get_actual_count(related_model, related_field)
+        updated += model.objects.annotate(actual=actual).filter(
+            ~Q(**{field: F('actual')})
+        ).update(**{field: actual})
+    return updated
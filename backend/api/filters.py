@@ -1,32 +1,81 @@
+from django.conf import settings
+from django.db.models import Count, Exists, IntegerField, OuterRef, Value
 from django_filters import rest_framework as filters
 
+from api.catalog import get_tag_ids
 from api.models import Ingredient, Recipe
 
+# Значение параметра ordering: (название, поля сортировки).
+# Каждой сортировке соответствует индекс модели Recipe.
+RECIPE_ORDERINGS = {
+    'popular': ('По популярности', ('-favorites_count', '-id')),
+    'cooking_time': ('По времени приготовления', ('cooking_time', 'id')),
+    'recent': ('По дате публикации', ('-pub_date', '-id')),
+}
+
 
 class RecipeFilter(filters.FilterSet):
     '''Фильтр модели рецепта.
 
     В данном фильтре котором реализаована возможность фильтрации рецептов
     по автору, множественным тэгам.
+    Слаги тэгов переводятся в id по словарю из кэша справочника, а рецепты
+    отбираются подзапросом к таблице связи без JOIN и DISTINCT.
+    Параметр tags_mode задаёт режим: any - хотя бы один из тэгов,
+    all - все тэги.
     Метод filter_is_favorited в качестве аргумента принимает queryset
     и возвращает объекты, добавленные в избранное.
     Метод filter_is_in_shopping_cart в качестве аргумента принимает queryset
     возвращает объекты, добавленные в пользовательскую корзину.
+    Параметр ordering задаёт сортировку из RECIPE_ORDERINGS; последним
+    полем сортировки всегда идёт id, что позволяет использовать
+    пагинацию по курсору.
     '''
 
-    tags = filters.AllValuesMultipleFilter(field_name='tags__slug')
+    tags = filters.MultipleChoiceFilter(
+        choices=lambda: [(slug, slug) for slug in get_tag_ids()],
+        method='filter_tags'
+    )
+    tags_mode = filters.ChoiceFilter(
+        choices=[('any', 'Любой из тэгов'), ('all', 'Все тэги')],
+        method='filter_tags_mode'
+    )
     author = filters.NumberFilter(field_name='author_id')
     is_favorited = filters.BooleanFilter(method='filter_is_favorited')
     is_in_shopping_cart = filters.BooleanFilter(
         method='filter_is_in_shopping_cart'
     )
+    ordering = filters.ChoiceFilter(
+        choices=[
+            (value, label) for value, (label, _) in RECIPE_ORDERINGS.items()
+        ],
+        method='filter_ordering'
+    )
 
     class Meta:
         model = Recipe
         fields = [
-            'tags', 'author', 'name', 'is_favorited', 'is_in_shopping_cart'
+            'tags', 'tags_mode', 'author', 'name', 'is_favorited',
+            'is_in_shopping_cart', 'ordering'
         ]
 
+    def filter_tags(self, queryset, name, value):
+        tag_ids = get_tag_ids()
+        tag_ids = {tag_ids[slug] for slug in value if slug in tag_ids}
+        recipe_tags = Recipe.tags.through.objects.filter(tag_id__in=tag_ids)
+        if self.form.cleaned_data.get('tags_mode') == 'all':
+            return queryset.filter(
+                id__in=recipe_tags.values('recipe_id').annotate(
+                    tags_count=Count('tag_id')
+                ).filter(tags_count=len(tag_ids)).values('recipe_id')
+            )
+        return queryset.filter(
+            Exists(recipe_tags.filter(recipe_id=OuterRef('id')))
+        )
+
+    def filter_tags_mode(self, queryset, name, value):
+        return queryset
+
     def filter_is_favorited(self, queryset, name, value):
         if value and self.request.user.is_authenticated:
             return queryset.filter(
@@ -41,11 +90,43 @@ class RecipeFilter(filters.FilterSet):
             )
         return queryset
 
+    def filter_ordering(self, queryset, name, value):
+        return queryset.order_by(*RECIPE_ORDERINGS[value][1])
+
 
 class IngredientFilter(filters.FilterSet):
+    '''Фильтр модели ингредиента.
 
-    name = filters.CharFilter(lookup_expr='startswith')
+    Поиск по названию регистронезависимый: сначала выдаются ингредиенты,
+    название которых начинается с введённой строки, затем - содержащие её.
+    Количество результатов ограничено INGREDIENT_SEARCH_LIMIT.
+    '''
+
+    name = filters.CharFilter(method='filter_name')
 
     class Meta:
         model = Ingredient
         fields = ['name']
+
+    def filter_name(self, queryset, name, value):
+        '''
+        Объединяет совпадения по началу названия и по подстроке.
+
+        Части выбираются отдельными запросами UNION ALL, чтобы первая
+        использовала индекс по префиксу, а вторая - триграммный индекс.
+        '''
+        value = value.strip()
+        if not value:
+            return queryset
+        queryset = queryset.order_by()
+        prefix = queryset.filter(
+            name__istartswith=value
+        ).annotate(match_rank=Value(0, output_field=IntegerField()))
+        substring = queryset.filter(
+            name__icontains=value
+        ).exclude(
+            name__istartswith=value
+        ).annotate(match_rank=Value(1, output_field=IntegerField()))
+        return prefix.union(substring, all=True).order_by(
+            'match_rank', 'name'
+        )[:settings.INGREDIENT_SEARCH_LIMIT]
@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand
+
+from api.models import Recipe
+from utils.images import create_renditions, delete_renditions
+
+
+class Command(BaseCommand):
+    help = (
+        'Создаёт уменьшенные копии картинок рецептов, у которых их нет '
+        'или которые устарели.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Пересоздать копии для всех рецептов.'
+        )
+
+    def handle(self, *args, **options):
+        created = 0
+        failed = 0
+        recipes = Recipe.objects.only(
+            'id', 'image', 'image_renditions'
+        ).order_by('id')
+        for recipe in recipes.iterator():
+            renditions = recipe.image_renditions
+            if not recipe.image or (
+                not options['force']
+                and renditions.get('source') == recipe.image.name
+            ):
+                continue
+            try:
+                new_renditions = create_renditions(recipe.image)
+            except (OSError, ValueError) as error:
+                failed += 1
+                self.stderr.write(f'Рецепт {recipe.id}: {error}')
+                continue
+            Recipe.objects.filter(id=recipe.id).update(
+                image_renditions=new_renditions
+            )
+            delete_renditions(recipe.image.storage, renditions)
+            created += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Созданы копии для {created} рецептов, ошибок: {failed}.'
+        ))
@@ -0,0 +1,67 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api.recommendations import (build_neighbors, evaluate_neighbors,
+                                 get_stale_recipe_ids)
+
+
+class Command(BaseCommand):
+    help = (
+        'Рассчитывает похожие рецепты по совместному избранному, '
+        'общим ингредиентам и тэгам.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--neighbors',
+            type=int,
+            default=settings.RECIPE_NEIGHBORS,
+            help='Количество похожих рецептов для каждого рецепта.'
+        )
+        parser.add_argument(
+            '--incremental',
+            action='store_true',
+            help=(
+                'Рассчитать только рецепты без похожих, например новые. '
+                'Соседи остальных рецептов не изменяются.'
+            )
+        )
+        parser.add_argument(
+            '--recipe',
+            type=int,
+            action='append',
+            dest='recipe_ids',
+            help='id рецепта для пересчёта; можно указать несколько раз.'
+        )
+        parser.add_argument(
+            '--evaluate',
+            type=int,
+            metavar='USERS',
+            help=(
+                'Не сохраняя результат, оценить долю угаданных скрытых '
+                'рецептов из избранного USERS пользователей.'
+            )
+        )
+
+    def handle(self, *args, **options):
+        started_at = time.monotonic()
+        if options['evaluate']:
+            recall, users_count = evaluate_neighbors(
+                options['neighbors'], options['evaluate']
+            )
+            self.stdout.write(self.style.SUCCESS(
+                f'Recall@{options["neighbors"]}: {recall:.3f} '
+                f'на {users_count} пользователях '
+                f'за {time.monotonic() - started_at:.2f} с.'
+            ))
+            return
+        recipe_ids = options['recipe_ids']
+        if options['incremental']:
+            recipe_ids = set(recipe_ids or ()) | set(get_stale_recipe_ids())
+        count = build_neighbors(options['neighbors'], recipe_ids)
+        self.stdout.write(self.style.SUCCESS(
+            f'Рассчитаны похожие рецепты для {count} рецептов '
+            f'за {time.monotonic() - started_at:.2f} с.'
+        ))
@@ -0,0 +1,186 @@
+import csv
+import json
+import re
+import time
+from itertools import islice
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from api.catalog import INGREDIENTS, bump_catalog_version
+from api.models import Ingredient
+
+DEFAULT_PATH = settings.BASE_DIR / 'data' / 'ingredients.csv'
+JSON_CHUNK_SIZE = 64 * 1024
+JSON_SEPARATORS = re.compile(r'[\s,]*')
+
+
+def get_ingredient(row, position):
+    '''
+    Возвращает название и единицу измерения из строки файла.
+
+    position - описание места строки в файле для сообщения об ошибке.
+    '''
+    try:
+        name, measurement_unit = row['name'], row['measurement_unit']
+    except (KeyError, TypeError):
+        name = measurement_unit = None
+    if not isinstance(name, str) or not isinstance(measurement_unit, str):
+        raise CommandError(
+            f'{position}: нужны строковые поля name и measurement_unit.'
+        )
+    return name, measurement_unit
+
+
+def read_csv(file):
+    '''Построчно читает ингредиенты из CSV-файла с заголовком.'''
+    reader = csv.DictReader(file)
+    for row in reader:
+        yield get_ingredient(row, f'Строка {reader.line_num}')
+
+
+def decode_json_objects(decoder, buffer):
+    '''Разбирает полные объекты из начала буфера и возвращает остаток.'''
+    objects = []
+    position = JSON_SEPARATORS.match(buffer).end()
+    while position < len(buffer) and buffer[position] != ']':
+        try:
+            obj, position = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            break
+        objects.append(obj)
+        position = JSON_SEPARATORS.match(buffer, position).end()
+    return objects, buffer[position:]
+
+
+def read_json(file):
+    '''
+    Читает ингредиенты из JSON-массива объектов.
+
+    Файл читается частями, и объекты разбираются по мере поступления,
+    поэтому весь массив в память не загружается.
+    '''
+    decoder = json.JSONDecoder()
+    buffer = file.read(JSON_CHUNK_SIZE).lstrip()
+    if not buffer.startswith('['):
+        raise CommandError('JSON-файл должен содержать массив.')
+    buffer = buffer[1:]
+    number = 0
+    while True:
+        rows, buffer = decode_json_objects(decoder, buffer)
+        for number, row in enumerate(rows, number + 1):
+            yield get_ingredient(row, f'Элемент {number}')
+        chunk = file.read(JSON_CHUNK_SIZE)
+        if not chunk:
+            break
+        buffer += chunk
+    if buffer.strip() != ']':
+        raise CommandError('Некорректный JSON-файл.')
+
+
+READERS = {
+    'csv': read_csv,
+    'json': read_json,
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Загружает ингредиенты из CSV- или JSON-файла. Существующие '
+        'ингредиенты не удаляются и не дублируются.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path',
+            nargs='?',
+            default=DEFAULT_PATH,
+            type=Path,
+            help=f'Путь к файлу, по умолчанию {DEFAULT_PATH}.'
+        )
+        parser.add_argument(
+            '--format',
+            choices=READERS,
+            dest='file_format',
+            help='Формат файла; по умолчанию определяется по расширению.'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Количество строк в одном INSERT.'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Показать изменения, не записывая их в базу.'
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['file_format'] or path.suffix.lstrip('.')
+        if file_format not in READERS:
+            raise CommandError(f'Неизвестный формат файла: {path}.')
+        existing = set(
+            Ingredient.objects.values_list('name', 'measurement_unit')
+        )
+        seen = set()
+        added = 0
+        processed = 0
+        started_at = time.monotonic()
+        with open(path, encoding='utf-8') as file:
+            rows = (
+                (name.strip(), measurement_unit.strip())
+                for name, measurement_unit in READERS[file_format](file)
+            )
+            batch = list(islice(rows, options['batch_size']))
+            while batch:
+                processed += len(batch)
+                new_rows = [
+                    row for row in batch
+                    if row not in existing and row not in seen
+                ]
+                seen.update(batch)
+                added += len(new_rows)
+                if options['dry_run']:
+                    for name, measurement_unit in new_rows:
+                        self.stdout.write(f'+ {name} ({measurement_unit})')
+                else:
+                    self.save(new_rows)
+                    self.report_progress(processed, added, started_at)
+                batch = list(islice(rows, options['batch_size']))
+        if options['dry_run']:
+            for name, measurement_unit in sorted(existing - seen):
+                self.stdout.write(
+                    f'= {name} ({measurement_unit}) - нет в файле, '
+                    'останется в базе'
+                )
+            self.stdout.write(
+                f'Будет добавлено: {added} из {processed} строк.'
+            )
+            return
+        if added:
+            bump_catalog_version(INGREDIENTS)
+        self.stdout.write(self.style.SUCCESS(
+            f'Загрузка завершена: добавлено {added} из {processed} строк '
+            f'за {time.monotonic() - started_at:.2f} с.'
+        ))
+
+    @transaction.atomic
+    def save(self, rows):
+        Ingredient.objects.bulk_create(
+            [
+                Ingredient(name=name, measurement_unit=measurement_unit)
+                for name, measurement_unit in rows
+            ],
+            ignore_conflicts=True
+        )
+
+    def report_progress(self, processed, added, started_at):
+        elapsed = time.monotonic() - started_at
+        self.stdout.write(
+            f'Обработано {processed} строк, добавлено {added} '
+            f'({processed / elapsed if elapsed else processed:.0f} строк/с)'
+        )
@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api.shopping_cart import check_cart_totals, rebuild_cart_totals
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает суммы ингредиентов в корзинах пользователей '
+        'или проверяет их соответствие таблице корзин (--check).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Только проверить суммы, не изменяя их.'
+        )
+        parser.add_argument(
+            '--user',
+            type=int,
+            action='append',
+            dest='author_ids',
+            help='id пользователя; можно указать несколько раз.'
+        )
+
+    def handle(self, *args, **options):
+        author_ids = options['author_ids']
+        if not options['check']:
+            rebuild_cart_totals(author_ids)
+            self.stdout.write(self.style.SUCCESS('Суммы пересчитаны.'))
+            return
+        mismatches = check_cart_totals(author_ids)
+        for author_id, ingredient_id, amount, total in mismatches:
+            self.stdout.write(
+                f'Пользователь {author_id}, ингредиент {ingredient_id}: '
+                f'сохранено {amount}, ожидается {total}'
+            )
+        if mismatches:
+            raise CommandError(f'Найдено расхождений: {len(mismatches)}.')
+        self.stdout.write(self.style.SUCCESS('Расхождений не найдено.'))
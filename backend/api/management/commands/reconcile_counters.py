@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api.counters import get_counter_drift, reconcile_counters
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает счётчики избранного, корзин, рецептов и подписчиков '
+        'или проверяет их соответствие данным (--check).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Только проверить счётчики, не изменяя их.'
+        )
+
+    def handle(self, *args, **options):
+        if not options['check']:
+            updated = reconcile_counters()
+            self.stdout.write(
+                self.style.SUCCESS(f'Исправлено строк: {updated}.')
+            )
+            return
+        drift = get_counter_drift()
+        for model, field, pk, value, actual in drift:
+            self.stdout.write(
+                f'{model._meta.verbose_name} {pk}, {field}: '
+                f'сохранено {value}, ожидается {actual}'
+            )
+        if drift:
+            raise CommandError(f'Найдено расхождений: {len(drift)}.')
+        self.stdout.write(self.style.SUCCESS('Расхождений не найдено.'))
@@ -0,0 +1,57 @@
+# Generated by Django 3.2.16 on 2026-10-18 02:52
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def fill_cart_ingredients(apps, schema_editor):
+    CartIngredient = apps.get_model('api', 'CartIngredient')
+    IngredientInRecipe = apps.get_model('api', 'IngredientInRecipe')
+    totals = IngredientInRecipe.objects.filter(
+        recipe__carts__isnull=False
+    ).values_list(
+        'recipe__carts__author_id', 'ingredient_id'
+    ).annotate(total=models.Sum('amount')).order_by()
+    CartIngredient.objects.bulk_create(
+        [
+            CartIngredient(
+                author_id=author_id, ingredient_id=ingredient_id, amount=total
+            )
+            for author_id, ingredient_id, total in totals
+        ],
+        batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('api', '0007_alter_recipe_image'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CartIngredient',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.IntegerField(default=0, verbose_name='Количество')),
+                ('author', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cart_ingredients', to=settings.AUTH_USER_MODEL, verbose_name='Автор')),
+                ('ingredient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cart_ingredients', to='api.ingredient', verbose_name='Ингредиент')),
+            ],
+            options={
+                'verbose_name': 'Ингредиент в корзине',
+                'verbose_name_plural': 'Ингредиенты в корзине',
+                'ordering': ('ingredient',),
+                'default_related_name': 'cart_ingredients',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='cartingredient',
+            constraint=models.UniqueConstraint(fields=('author', 'ingredient'), name='unique_cart_ingredient'),
+        ),
+        migrations.RunPython(
+            fill_cart_ingredients, migrations.RunPython.noop
+        ),
+    ]
@@ -0,0 +1,27 @@
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_cartingredient'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.RunSQL(
+            sql=(
+                'CREATE INDEX api_ingredient_name_upper_prefix_idx '
+                'ON api_ingredient (UPPER(name::text) text_pattern_ops);'
+            ),
+            reverse_sql='DROP INDEX api_ingredient_name_upper_prefix_idx;',
+        ),
+        migrations.RunSQL(
+            sql=(
+                'CREATE INDEX api_ingredient_name_upper_trgm_idx '
+                'ON api_ingredient USING gin (UPPER(name::text) gin_trgm_ops);'
+            ),
+            reverse_sql='DROP INDEX api_ingredient_name_upper_trgm_idx;',
+        ),
+    ]
@@ -0,0 +1,91 @@
+# Generated by Django 3.2.16 on 2026-10-18 02:57
+
+from django.db import migrations, models
+
+
+def delete_duplicates(model, fields):
+    '''Удаляет повторяющиеся строки, оставляя строку с наименьшим id.'''
+    duplicates = model.objects.values(*fields).annotate(
+        min_id=models.Min('id'), count=models.Count('id')
+    ).filter(count__gt=1).order_by()
+    deleted = 0
+    for duplicate in duplicates:
+        min_id = duplicate.pop('min_id')
+        duplicate.pop('count')
+        deleted += model.objects.filter(**duplicate).exclude(
+            id=min_id
+        ).delete()[0]
+    return deleted
+
+
+def merge_ingredients_in_recipes(model):
+    '''Суммирует количество повторяющихся ингредиентов рецепта.'''
+    duplicates = model.objects.values('recipe', 'ingredient').annotate(
+        min_id=models.Min('id'),
+        count=models.Count('id'),
+        total=models.Sum('amount')
+    ).filter(count__gt=1).order_by()
+    merged = 0
+    for duplicate in duplicates:
+        model.objects.filter(id=duplicate['min_id']).update(
+            amount=duplicate['total']
+        )
+        merged += model.objects.filter(
+            recipe=duplicate['recipe'], ingredient=duplicate['ingredient']
+        ).exclude(id=duplicate['min_id']).delete()[0]
+    return merged
+
+
+def rebuild_cart_ingredients(apps):
+    CartIngredient = apps.get_model('api', 'CartIngredient')
+    IngredientInRecipe = apps.get_model('api', 'IngredientInRecipe')
+    CartIngredient.objects.all().delete()
+    totals = IngredientInRecipe.objects.filter(
+        recipe__carts__isnull=False
+    ).values_list(
+        'recipe__carts__author_id', 'ingredient_id'
+    ).annotate(total=models.Sum('amount')).order_by()
+    CartIngredient.objects.bulk_create(
+        [
+            CartIngredient(
+                author_id=author_id, ingredient_id=ingredient_id, amount=total
+            )
+            for author_id, ingredient_id, total in totals
+        ],
+        batch_size=1000
+    )
+
+
+def remove_duplicates(apps, schema_editor):
+    delete_duplicates(apps.get_model('api', 'Favorite'), ('author', 'recipe'))
+    changed = delete_duplicates(
+        apps.get_model('api', 'Cart'), ('author', 'recipe')
+    )
+    changed += merge_ingredients_in_recipes(
+        apps.get_model('api', 'IngredientInRecipe')
+    )
+    if changed:
+        rebuild_cart_ingredients(apps)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_recipe_pub_date_id_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='cart',
+            constraint=models.UniqueConstraint(fields=('author', 'recipe'), name='unique_cart'),
+        ),
+        migrations.AddConstraint(
+            model_name='favorite',
+            constraint=models.UniqueConstraint(fields=('author', 'recipe'), name='unique_favorite'),
+        ),
+        migrations.AddConstraint(
+            model_name='ingredientinrecipe',
+            constraint=models.UniqueConstraint(fields=('recipe', 'ingredient'), name='unique_ingredient_in_recipe'),
+        ),
+    ]
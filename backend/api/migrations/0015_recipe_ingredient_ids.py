@@ -0,0 +1,44 @@
+# Generated by Django 3.2.16 on 2026-10-18 03:05
+
+import django.contrib.postgres.fields
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+from django.db.models import Func, OuterRef, Subquery
+
+
+def fill_ingredient_ids(apps, schema_editor):
+    Recipe = apps.get_model('api', 'Recipe')
+    IngredientInRecipe = apps.get_model('api', 'IngredientInRecipe')
+    Recipe.objects.update(
+        ingredient_ids=Func(
+            Subquery(
+                IngredientInRecipe.objects.filter(
+                    recipe=OuterRef('pk')
+                ).values('ingredient_id')
+            ),
+            template='ARRAY%(expressions)s',
+            output_field=django.contrib.postgres.fields.ArrayField(
+                models.BigIntegerField()
+            )
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0014_recipe_search_vector'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='ingredient_ids',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.BigIntegerField(), default=list, editable=False, size=None, verbose_name='id ингредиентов'),
+        ),
+        migrations.RunPython(fill_ingredient_ids, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['ingredient_ids'], name='recipe_ingredient_ids_idx'),
+        ),
+    ]
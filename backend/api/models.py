@@ -1,9 +1,16 @@
 from colorfield.fields import ColorField
 from django.conf import settings
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector, SearchVectorField
 from django.core.validators import MinValueValidator
-from django.db import models
+from django.db import connections, models
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Cast
 
 from users.models import User
+from utils.models import CountersModelMixin
 
 
 class Tag(models.Model):
@@ -59,7 +66,118 @@ class Ingredient(models.Model):
         return f'{self.name}'
 
 
-class Recipe(models.Model):
+class RecipeQuerySet(models.QuerySet):
+    '''Набор запросов модели Recipe.'''
+
+    def with_related(self):
+        '''
+        Подгружает связанные объекты, которые читает RecipeSerializer.
+
+        Автор выбирается через JOIN, тэги и ингредиенты рецептов вместе
+        с самими ингредиентами - отдельными запросами на всю выборку,
+        поэтому число запросов не зависит от размера страницы.
+        '''
+        return self.select_related('author').defer(
+            'search_vector', 'ingredient_ids'
+        ).prefetch_related(
+            'tags',
+            models.Prefetch(
+                'ingredient_recipes',
+                queryset=IngredientInRecipe.objects.select_related(
+                    'ingredient'
+                )
+            )
+        )
+
+    def update_search_fields(self):
+        '''
+        Пересчитывает поля поиска рецептов выборки одним запросом.
+
+        Поисковый вектор строится из названия (вес A), текста (вес B)
+        и названий ингредиентов рецепта (вес C), а ingredient_ids -
+        массив id ингредиентов рецепта.
+        '''
+        config = settings.SEARCH_CONFIG
+        ingredient_names = IngredientInRecipe.objects.filter(
+            recipe=models.OuterRef('pk')
+        ).order_by().values('recipe').annotate(
+            names=StringAgg('ingredient__name', ' ')
+        ).values('names')
+        return self.update(
+            search_vector=(
+                SearchVector('name', weight='A', config=config)
+                + SearchVector('text', weight='B', config=config)
+                + SearchVector(
+                    models.Subquery(ingredient_names),
+                    weight='C',
+                    config=config
+                )
+            ),
+            ingredient_ids=models.Func(
+                models.Subquery(
+                    IngredientInRecipe.objects.filter(
+                        recipe=models.OuterRef('pk')
+                    ).values('ingredient_id')
+                ),
+                template='ARRAY%(expressions)s',
+                output_field=ArrayField(models.BigIntegerField())
+            )
+        )
+
+    def with_ingredient_coverage(self, ingredient_ids):
+        '''
+        Выбирает рецепты, в которых есть хотя бы один из ингредиентов.
+
+        Пересечение ищется по GIN-индексу массива ingredient_ids без JOIN
+        с IngredientInRecipe. Добавляются поля missing_count - число
+        недостающих ингредиентов рецепта и coverage - доля имеющихся.
+        '''
+        matched_count = RawSQL(
+            'SELECT COUNT(*) FROM UNNEST('
+            f'{connections[self.db].ops.quote_name(self.model._meta.db_table)}'
+            '.ingredient_ids) AS ingredient(id) WHERE ingredient.id = ANY(%s)',
+            (list(ingredient_ids),),
+            output_field=models.IntegerField()
+        )
+        return self.filter(
+            ingredient_ids__overlap=list(ingredient_ids)
+        ).alias(
+            matched_count=matched_count,
+            total_count=models.Func(
+                'ingredient_ids',
+                function='CARDINALITY',
+                output_field=models.IntegerField()
+            ),
+        ).annotate(
+            missing_count=models.F('total_count') - models.F('matched_count'),
+            coverage=models.ExpressionWrapper(
+                Cast('matched_count', models.FloatField())
+                / models.F('total_count'),
+                output_field=models.FloatField()
+            )
+        )
+
+    def with_user_flags(self, user):
+        '''Добавляет поля is_favorited и is_in_shopping_cart.'''
+        if not user.is_authenticated:
+            return self
+        return self.annotate(
+            is_favorited=models.Exists(
+                Favorite.objects.filter(
+                    recipe=models.OuterRef('id'),
+                    author=user
+                )
+            ),
+            is_in_shopping_cart=models.Exists(
+                Cart.objects.filter(
+                    recipe=models.OuterRef('id'),
+                    author=user
+                )
+            )
+        )
+
+
+class Recipe(CountersModelMixin, models.Model):
     '''Модель рецепта.'''
 
     tags = models.ManyToManyField(
@@ -102,11 +220,64 @@ class Recipe(models.Model):
             ),
         )
     )
+    favorites_count = models.PositiveIntegerField(
+        'Добавлений в избранное',
+        default=0
+    )
+    carts_count = models.PositiveIntegerField(
+        'Добавлений в корзину',
+        default=0
+    )
+    search_vector = SearchVectorField(
+        'Поисковый вектор',
+        null=True,
+        editable=False
+    )
+    image_renditions = models.JSONField(
+        'Уменьшенные копии картинки',
+        default=dict,
+        editable=False
+    )
+    ingredient_ids = ArrayField(
+        models.BigIntegerField(),
+        verbose_name='id ингредиентов',
+        default=list,
+        editable=False
+    )
+
+    objects = RecipeQuerySet.as_manager()
+    counter_fields = ('favorites_count', 'carts_count')
 
     class Meta:
         ordering = ('-pub_date',)
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
+        indexes = [
+            models.Index(
+                fields=['-pub_date', '-id'],
+                name='recipe_pub_date_id_idx'
+            ),
+            models.Index(
+                fields=['author', '-pub_date', '-id'],
+                name='recipe_author_pub_date_id_idx'
+            ),
+            models.Index(
+                fields=['-favorites_count', '-id'],
+                name='recipe_favorites_id_idx'
+            ),
+            models.Index(
+                fields=['cooking_time', 'id'],
+                name='recipe_cooking_time_id_idx'
+            ),
+            GinIndex(
+                fields=['search_vector'],
+                name='recipe_search_vector_idx'
+            ),
+            GinIndex(
+                fields=['ingredient_ids'],
+                name='recipe_ingredient_ids_idx'
+            ),
+        ]
 
     def __str__(self):
         return f'{self.name}'
@@ -142,11 +313,79 @@ class IngredientInRecipe(models.Model):
         verbose_name = 'Ингредиент в рецепте'
         verbose_name_plural = 'Ингредиенты в рецептах'
         ordering = ('ingredient',)
+        constraints = [
+            models.UniqueConstraint(
+                fields=['recipe', 'ingredient'],
+                name='unique_ingredient_in_recipe'
+            )
+        ]
 
     def __str__(self):
         return f'{self.recipe}'
 
 
+class UserRecipeQuerySet(models.QuerySet):
+    '''
+    Набор запросов моделей Favorite и Cart.
+
+    Вместе с записью изменяется счётчик рецепта, имя которого задано
+    атрибутом recipe_counter модели.
+    '''
+
+    def add(self, author, recipe_id):
+        '''
+        Добавляет рецепт пользователю и возвращает его.
+
+        Вставка выполняется одним запросом INSERT ... ON CONFLICT DO NOTHING,
+        который также увеличивает счётчик рецепта и возвращает его данные,
+        поэтому параллельные запросы не создают дубликатов. Если рецепта нет
+        или он уже добавлен, возвращается None.
+        '''
+        quote_name = connections[self.db].ops.quote_name
+        table = quote_name(self.model._meta.db_table)
+        recipes = quote_name(Recipe._meta.db_table)
+        counter = quote_name(self.model.recipe_counter)
+        added_recipes = Recipe.objects.db_manager(self.db).raw(
+            f'WITH added AS ('
+            f'    INSERT INTO {table} (recipe_id, author_id)'
+            f'    SELECT id, %s FROM {recipes} WHERE id = %s'
+            '    ON CONFLICT DO NOTHING RETURNING recipe_id'
+            f') UPDATE {recipes} AS recipe'
+            f' SET {counter} = recipe.{counter} + 1'
+            ' FROM added WHERE recipe.id = added.recipe_id'
+            ' RETURNING recipe.id, recipe.name, recipe.image,'
+            ' recipe.image_renditions, recipe.cooking_time',
+            [author.id, recipe_id]
+        )
+        return next(iter(added_recipes), None)
+
+    def remove(self, author, recipe_id):
+        '''
+        Удаляет рецепт у пользователя одним запросом DELETE ... RETURNING.
+
+        Тот же запрос уменьшает счётчик рецепта.
+        Возвращает True, если запись была удалена.
+        '''
+        connection = connections[self.db]
+        quote_name = connection.ops.quote_name
+        table = quote_name(self.model._meta.db_table)
+        recipes = quote_name(Recipe._meta.db_table)
+        counter = quote_name(self.model.recipe_counter)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'WITH removed AS ('
+                f'    DELETE FROM {table}'
+                '    WHERE author_id = %s AND recipe_id = %s'
+                '    RETURNING recipe_id'
+                f') UPDATE {recipes} AS recipe'
+                f' SET {counter} = GREATEST(recipe.{counter} - 1, 0)'
+                ' FROM removed WHERE recipe.id = removed.recipe_id'
+                ' RETURNING recipe.id',
+                [author.id, recipe_id]
+            )
+            return cursor.fetchone() is not None
+
+
 class Favorite(models.Model):
     '''Модель избранных рецпетов.'''
 
@@ -158,14 +397,24 @@ class Favorite(models.Model):
     author = models.ForeignKey(
         User,
         verbose_name='Автор',
-        on_delete=models.CASCADE
+        on_delete=models.CASCADE,
+        db_index=False
     )
 
+    objects = UserRecipeQuerySet.as_manager()
+    recipe_counter = 'favorites_count'
+
     class Meta:
         ordering = ('recipe',)
         verbose_name = 'Избранный рецепт'
         verbose_name_plural = 'Избранные рецепты'
         default_related_name = 'favorites'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['author', 'recipe'],
+                name='unique_favorite'
+            )
+        ]
 
     def __str__(self):
         return f'{self.recipe}'
@@ -182,14 +431,103 @@ class Cart(models.Model):
     author = models.ForeignKey(
         User,
         verbose_name='Автор',
-        on_delete=models.CASCADE
+        on_delete=models.CASCADE,
+        db_index=False
     )
 
+    objects = UserRecipeQuerySet.as_manager()
+    recipe_counter = 'carts_count'
+
     class Meta:
         ordering = ('recipe',)
         verbose_name = 'Рецепт в корзине'
         verbose_name_plural = 'Рецепты в корзине'
         default_related_name = 'carts'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['author', 'recipe'],
+                name='unique_cart'
+            )
+        ]
 
     def __str__(self):
         return f'{self.recipe}'
+
+
+class CartIngredient(models.Model):
+    '''
+    Модель суммарного количества ингредиентов в корзине пользователя.
+
+    Записи обновляются при добавлении и удалении рецептов из корзины
+    и при изменении ингредиентов рецепта, поэтому список покупок
+    не пересчитывается при каждом скачивании.
+    '''
+
+    author = models.ForeignKey(
+        User,
+        verbose_name='Автор',
+        on_delete=models.CASCADE
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        verbose_name='Ингредиент',
+        on_delete=models.CASCADE
+    )
+    amount = models.IntegerField(
+        'Количество',
+        default=0
+    )
+
+    class Meta:
+        ordering = ('ingredient',)
+        verbose_name = 'Ингредиент в корзине'
+        verbose_name_plural = 'Ингредиенты в корзине'
+        default_related_name = 'cart_ingredients'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['author', 'ingredient'],
+                name='unique_cart_ingredient'
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.ingredient}'
+
+
+class RecipeNeighbor(models.Model):
+    '''
+    Модель похожего рецепта.
+
+    Записи рассчитываются командой build_recipe_neighbors по совместным
+    добавлениям в избранное, общим ингредиентам и тэгам.
+    '''
+
+    recipe = models.ForeignKey(
+        Recipe,
+        verbose_name='Рецепт',
+        on_delete=models.CASCADE,
+        related_name='neighbors'
+    )
+    neighbor = models.ForeignKey(
+        Recipe,
+        verbose_name='Похожий рецепт',
+        on_delete=models.CASCADE,
+        related_name='neighbor_of'
+    )
+    score = models.FloatField(
+        'Сходство'
+    )
+
+    class Meta:
+        ordering = ('recipe', '-score')
+        verbose_name = 'Похожий рецепт'
+        verbose_name_plural = 'Похожие рецепты'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['recipe', 'neighbor'],
+                name='unique_recipe_neighbor'
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.recipe} - {self.neighbor}'
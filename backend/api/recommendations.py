@@ -0,0 +1,281 @@
+import numpy as np
+from django.db import connection, transaction
+from scipy import sparse
+
+from api.models import Favorite, IngredientInRecipe, Recipe, RecipeNeighbor
+
+FAVORITES_WEIGHT = 1.0  # Вес сходства по совместному избранному.
+INGREDIENTS_WEIGHT = 0.5  # Вес сходства по общим ингредиентам.
+TAGS_WEIGHT = 0.2  # Надбавка к сходству за общие тэги.
+MAX_INGREDIENT_SHARE = 0.1  # Более частые ингредиенты не учитываются.
+BLOCK_SIZE = 512  # Количество рецептов, обрабатываемых за один шаг.
+SAVE_BATCH_SIZE = 50000  # Количество строк в одном INSERT.
+
+
+def load_recipe_ids():
+    '''Загружает отсортированный массив id всех рецептов.'''
+    return np.fromiter(
+        Recipe.objects.order_by('id').values_list('id', flat=True),
+        dtype=np.int64
+    )
+
+
+def load_pairs(queryset, *fields):
+    '''Загружает пары id из queryset в два массива numpy.'''
+    pairs = np.fromiter(
+        (value for row in queryset.values_list(*fields) for value in row),
+        dtype=np.int64
+    ).reshape(-1, 2)
+    return pairs[:, 0], pairs[:, 1]
+
+
+def get_incidence_matrix(recipe_ids, rows, columns):
+    '''
+    Строит разреженную матрицу "рецепт - объект" из пар id.
+
+    Строки матрицы соответствуют отсортированному массиву recipe_ids,
+    столбцы - различным значениям columns. Данные загружаются разными
+    запросами, поэтому пары рецептов, созданных или удалённых между
+    ними, могут отсутствовать в recipe_ids; такие пары пропускаются.
+    '''
+    known = np.isin(rows, recipe_ids)
+    rows, columns = rows[known], columns[known]
+    _, columns = np.unique(columns, return_inverse=True)
+    return sparse.csr_matrix(
+        (
+            np.ones(len(rows), dtype=np.float32),
+            (np.searchsorted(recipe_ids, rows), columns)
+        ),
+        shape=(len(recipe_ids), columns.max() + 1 if len(columns) else 0)
+    )
+
+
+def normalize_rows(matrix):
+    '''Нормирует строки матрицы, чтобы произведение строк было косинусом.'''
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    scale = np.divide(
+        1, norms, out=np.zeros_like(norms), where=norms > 0
+    ).astype(np.float32)
+    return sparse.diags(scale) @ matrix
+
+
+class RecipeFeatures:
+    '''
+    Признаки рецептов для расчёта сходства.
+
+    favorites - рецепты на пользователей, добавивших их в избранное,
+    с меньшим весом активных пользователей; ingredients - рецепты
+    на ингредиенты с весами TF-IDF; tags - плотная матрица тэгов.
+    Строки всех матриц нормированы.
+    '''
+
+    def __init__(self, recipe_ids, favorites, ingredients, tags):
+        self.recipe_ids = recipe_ids
+        self.favorites = self.get_favorites_matrix(*favorites)
+        self.ingredients = self.get_ingredients_matrix(*ingredients)
+        self.tags = normalize_rows(
+            self.get_matrix(*tags)
+        ).toarray()
+
+    @classmethod
+    def load(cls):
+        '''Загружает признаки всех рецептов из базы.'''
+        return cls(
+            load_recipe_ids(),
+            load_pairs(Favorite.objects.order_by(), 'recipe_id', 'author_id'),
+            load_pairs(
+                IngredientInRecipe.objects.order_by(),
+                'recipe_id', 'ingredient_id'
+            ),
+            load_pairs(
+                Recipe.tags.through.objects.order_by(), 'recipe_id', 'tag_id'
+            )
+        )
+
+    def get_matrix(self, rows, columns):
+        return get_incidence_matrix(self.recipe_ids, rows, columns)
+
+    def get_favorites_matrix(self, rows, columns):
+        matrix = self.get_matrix(rows, columns).tocsc()
+        activity = np.diff(matrix.indptr)
+        matrix = matrix @ sparse.diags(
+            (1 / np.log2(1 + np.maximum(activity, 1))).astype(np.float32)
+        )
+        return normalize_rows(matrix.tocsr())
+
+    def get_ingredients_matrix(self, rows, columns):
+        matrix = self.get_matrix(rows, columns).tocsc()
+        frequency = np.diff(matrix.indptr) / max(len(self.recipe_ids), 1)
+        idf = np.where(
+            frequency <= MAX_INGREDIENT_SHARE,
+            -np.log(np.maximum(frequency, 1e-12)),
+            0
+        ).astype(np.float32)
+        matrix = matrix @ sparse.diags(idf)
+        matrix.eliminate_zeros()
+        return normalize_rows(matrix.tocsr())
+
+    def get_neighbors(self, rows, k):
+        '''
+        Возвращает k ближайших соседей для рецептов с номерами rows.
+
+        Сходство считается блоками по BLOCK_SIZE рецептов произведением
+        разреженных матриц, поэтому в памяти не хранится матрица
+        сходства всех рецептов. Результат - массивы номеров рецептов,
+        номеров соседей и оценок сходства.
+        '''
+        results = []
+        for start in range(0, len(rows), BLOCK_SIZE):
+            block = rows[start:start + BLOCK_SIZE]
+            scores = (
+                FAVORITES_WEIGHT
+                * (self.favorites[block] @ self.favorites.T)
+                + INGREDIENTS_WEIGHT
+                * (self.ingredients[block] @ self.ingredients.T)
+            ).tocoo()
+            recipes = block[scores.row]
+            mask = (recipes != scores.col) & (scores.data > 0)
+            block_rows = scores.row[mask]
+            recipes = recipes[mask]
+            neighbors = scores.col[mask]
+            tags = np.einsum(
+                'ij,ij->i', self.tags[recipes], self.tags[neighbors]
+            )
+            values = scores.data[mask] * (1 + TAGS_WEIGHT * tags)
+            order = np.lexsort((-values, block_rows))
+            block_rows = block_rows[order]
+            rank = np.arange(len(order)) - np.searchsorted(
+                block_rows, block_rows
+            )
+            keep = order[rank < k]
+            results.append((recipes[keep], neighbors[keep], values[keep]))
+        if not results:
+            return (np.array([], dtype=np.int64),) * 2 + (np.array([]),)
+        return tuple(np.concatenate(parts) for parts in zip(*results))
+
+
+@transaction.atomic
+def save_neighbors(features, rows, neighbors, scores, recipe_ids=None):
+    '''
+    Сохраняет соседей рецептов.
+
+    Если recipe_ids не задан, таблица заполняется заново,
+    иначе заменяются только соседи перечисленных рецептов.
+    Строки вставляются пачками по SAVE_BATCH_SIZE запросом
+    INSERT ... SELECT FROM UNNEST из трёх массивов.
+    '''
+    neighbors_queryset = RecipeNeighbor.objects.all()
+    if recipe_ids is not None:
+        neighbors_queryset = neighbors_queryset.filter(
+            recipe_id__in=recipe_ids
+        )
+    neighbors_queryset.delete()
+    recipe_ids = features.recipe_ids[rows]
+    neighbor_ids = features.recipe_ids[neighbors]
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), SAVE_BATCH_SIZE):
+            end = start + SAVE_BATCH_SIZE
+            cursor.execute(
+                f'INSERT INTO {RecipeNeighbor._meta.db_table}'
+                ' (recipe_id, neighbor_id, score)'
+                ' SELECT * FROM UNNEST(%s::bigint[], %s::bigint[],'
+                ' %s::double precision[])',
+                [
+                    recipe_ids[start:end].tolist(),
+                    neighbor_ids[start:end].tolist(),
+                    scores[start:end].tolist()
+                ]
+            )
+
+
+def build_neighbors(k, recipe_ids=None):
+    '''
+    Пересчитывает k похожих рецептов.
+
+    Если recipe_ids задан, пересчитываются только эти рецепты.
+    Возвращает количество обработанных рецептов.
+    '''
+    features = RecipeFeatures.load()
+    rows = np.arange(len(features.recipe_ids))
+    if recipe_ids is not None:
+        rows = rows[np.isin(features.recipe_ids, list(recipe_ids))]
+        recipe_ids = features.recipe_ids[rows].tolist()
+    save_neighbors(features, *features.get_neighbors(rows, k), recipe_ids)
+    return len(rows)
+
+
+def get_stale_recipe_ids():
+    '''Возвращает id рецептов, для которых ещё не рассчитаны соседи.'''
+    return Recipe.objects.filter(neighbors__isnull=True).values_list(
+        'id', flat=True
+    )
+
+
+def evaluate_neighbors(k, users_count, seed=0):
+    '''
+    Оценивает качество рекомендаций на отложенном избранном.
+
+    У случайных users_count пользователей, у которых не меньше двух
+    рецептов в избранном, скрывается один из них. По остальным данным
+    рассчитываются соседи, и рекомендации пользователю строятся как
+    сумма соседей его избранного. Возвращает долю пользователей,
+    у которых скрытый рецепт попал в первые k рекомендаций,
+    и число оценённых пользователей.
+    '''
+    random = np.random.default_rng(seed)
+    recipe_ids = load_recipe_ids()
+    recipes, authors = load_pairs(
+        Favorite.objects.order_by(), 'recipe_id', 'author_id'
+    )
+    known = np.isin(recipes, recipe_ids)
+    recipes, authors = recipes[known], authors[known]
+    order = random.permutation(len(authors))
+    recipes, authors = recipes[order], authors[order]
+    author_ids, first, counts = np.unique(
+        authors, return_index=True, return_counts=True
+    )
+    candidates = np.flatnonzero(counts >= 2)
+    sample = random.choice(
+        candidates, min(users_count, len(candidates)), replace=False
+    )
+    hidden = np.zeros(len(authors), dtype=bool)
+    hidden[first[sample]] = True
+    features = RecipeFeatures(
+        recipe_ids,
+        (recipes[~hidden], authors[~hidden]),
+        load_pairs(
+            IngredientInRecipe.objects.order_by(),
+            'recipe_id', 'ingredient_id'
+        ),
+        load_pairs(
+            Recipe.tags.through.objects.order_by(), 'recipe_id', 'tag_id'
+        )
+    )
+    size = len(features.recipe_ids)
+    rows, neighbors, scores = features.get_neighbors(np.arange(size), k)
+    similarity = sparse.csr_matrix(
+        (scores, (rows, neighbors)), shape=(size, size)
+    )
+    sampled = np.isin(authors, author_ids[sample]) & ~hidden
+    _, users = np.unique(authors[sampled], return_inverse=True)
+    known = sparse.csr_matrix(
+        (
+            np.ones(len(users), dtype=np.float32),
+            (users, np.searchsorted(features.recipe_ids, recipes[sampled]))
+        ),
+        shape=(len(sample), size)
+    )
+    recommendations = known @ similarity
+    expected = np.searchsorted(
+        features.recipe_ids,
+        recipes[hidden][np.argsort(authors[hidden])]
+    )
+    hits = 0
+    for user, recipe in enumerate(expected):
+        start, end = recommendations.indptr[user:user + 2]
+        candidates = recommendations.indices[start:end]
+        values = recommendations.data[start:end]
+        values = np.where(np.isin(candidates, known[user].indices), 0, values)
+        top = candidates[np.argsort(-values)[:k]]
+        hits += recipe in top
+    return hits / max(len(sample), 1), len(sample)
@@ -1,13 +1,13 @@
 from django.conf import settings
 from django.core.exceptions import ValidationError
+from django.db import transaction
 from drf_extra_fields.fields import Base64ImageField
 from rest_framework import serializers
 
-from api.models import (Cart, Favorite, Ingredient, IngredientInRecipe, Recipe,
-                        Tag)
+from api.models import Ingredient, IngredientInRecipe, Recipe, Tag
+from api.shopping_cart import update_recipe_cart_totals
 from users.serializers import UserSerializer
-from utils.serializers import (SimpleRecipeSerializer, raise_validation_error,
-                               validate_cart_favorite,
+from utils.serializers import (ImageRenditionsField, raise_validation_error,
                                validate_existing_object)
 
 
@@ -42,10 +42,6 @@ class IngredientInRecipeAddSerializer(serializers.ModelSerializer):
         model = IngredientInRecipe
         fields = ('id', 'amount')
 
-    def validate(self, data):
-        self.validate_ingredients(data)
-        return super().validate(data)
-
     def validate_amount(self, value):
         if value < settings.MIN_AMOUNT:
             raise ValidationError(
@@ -53,10 +49,6 @@ class IngredientInRecipeAddSerializer(serializers.ModelSerializer):
             )
         return value
 
-    def validate_ingredients(self, data):
-        if not Ingredient.objects.filter(id=data.get('id')).exists():
-            raise_validation_error('Несуществующий ингредиент')
-
 
 class IngredientInRecipeSerializer(serializers.ModelSerializer):
     '''
@@ -94,16 +86,33 @@ class RecipeSerializer(serializers.ModelSerializer):
         many=True,
         source='ingredient_recipes'
     )
+    images = ImageRenditionsField()
 
     class Meta:
         model = Recipe
         fields = (
             'id', 'tags', 'author', 'ingredients',
-            'name', 'image', 'text', 'cooking_time',
-            'is_in_shopping_cart', 'is_favorited'
+            'name', 'image', 'images', 'text', 'cooking_time',
+            'is_in_shopping_cart', 'is_favorited',
+            'favorites_count', 'carts_count'
         )
 
 
+class RecipeCoverageSerializer(RecipeSerializer):
+    '''
+    Сериализатор модели Recipe для подбора рецептов по ингредиентам.
+
+    Дополнительно возвращает долю имеющихся ингредиентов
+    и количество недостающих.
+    '''
+
+    coverage = serializers.FloatField()
+    missing_count = serializers.IntegerField()
+
+    class Meta(RecipeSerializer.Meta):
+        fields = RecipeSerializer.Meta.fields + ('coverage', 'missing_count')
+
+
 class RecipeAddSerializer(serializers.ModelSerializer):
     '''
     Сериализатор модели Recipe.
@@ -112,9 +121,8 @@ class RecipeAddSerializer(serializers.ModelSerializer):
     '''
 
     image = Base64ImageField(required=True)
-    tags = serializers.PrimaryKeyRelatedField(
-        queryset=Tag.objects.all(),
-        many=True, required=True
+    tags = serializers.ListField(
+        child=serializers.IntegerField(), required=True
     )
     ingredients = IngredientInRecipeAddSerializer(
         many=True, required=True
@@ -156,6 +164,22 @@ class RecipeAddSerializer(serializers.ModelSerializer):
         validate_existing_object(tags, Tag)
         return super().validate(data)
 
+    def validate_tags(self, value):
+        '''Проверяет существование всех тэгов одним запросом.'''
+        tag_ids = set(value)
+        if Tag.objects.filter(id__in=tag_ids).count() < len(tag_ids):
+            raise_validation_error('Несуществующий тэг')
+        return value
+
+    def validate_ingredients(self, value):
+        '''Проверяет существование всех ингредиентов одним запросом.'''
+        ingredient_ids = {ingredient['id'] for ingredient in value}
+        if Ingredient.objects.filter(
+            id__in=ingredient_ids
+        ).count() < len(ingredient_ids):
+            raise_validation_error('Несуществующий ингредиент')
+        return value
+
     def create_ingredint_in_recipe(self, ingredients_data, recipe):
         ingredients = [
             IngredientInRecipe(
@@ -164,6 +188,51 @@ class RecipeAddSerializer(serializers.ModelSerializer):
             ) for ingredient in ingredients_data]
         IngredientInRecipe.objects.bulk_create(ingredients)
 
+    def update_ingredients_in_recipe(self, ingredients_data, recipe):
+        '''
+        Приводит ингредиенты рецепта к ingredients_data.
+
+        Новые строки создаются, изменённые количества обновляются,
+        а лишние строки удаляются пачками; неизменные строки
+        не затрагиваются. Возвращает словари {id ингредиента: количество}
+        до и после изменения.
+        '''
+        current = {
+            ingredient.ingredient_id: ingredient
+            for ingredient in IngredientInRecipe.objects.filter(
+                recipe=recipe
+            )
+        }
+        old_amounts = {
+            ingredient_id: ingredient.amount
+            for ingredient_id, ingredient in current.items()
+        }
+        new_amounts = {
+            ingredient.get('id'): ingredient.get('amount')
+            for ingredient in ingredients_data
+        }
+        changed = []
+        for ingredient_id, amount in new_amounts.items():
+            ingredient = current.get(ingredient_id)
+            if ingredient is not None and ingredient.amount != amount:
+                ingredient.amount = amount
+                changed.append(ingredient)
+        IngredientInRecipe.objects.bulk_create([
+            IngredientInRecipe(
+                recipe=recipe, ingredient_id=ingredient_id, amount=amount
+            )
+            for ingredient_id, amount in new_amounts.items()
+            if ingredient_id not in current
+        ])
+        IngredientInRecipe.objects.bulk_update(changed, ['amount'])
+        removed = current.keys() - new_amounts.keys()
+        if removed:
+            IngredientInRecipe.objects.filter(
+                id__in=[current[ingredient_id].id for ingredient_id in removed]
+            ).delete()
+        return old_amounts, new_amounts
+
+    @transaction.atomic
     def create(self, validated_data):
         validated_data.update(
             {
@@ -176,53 +245,27 @@ class RecipeAddSerializer(serializers.ModelSerializer):
         recipe = Recipe.objects.create(**validated_data)
         recipe.tags.set(tags)
         self.create_ingredint_in_recipe(ingredients_data, recipe)
+        Recipe.objects.filter(id=recipe.id).update_search_fields()
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         ingredients_data = validated_data.pop('ingredients')
         tags = validated_data.pop('tags')
         instance.tags.set(tags)
-        instance.ingredients.clear()
-        self.create_ingredint_in_recipe(ingredients_data, instance)
+        update_recipe_cart_totals(
+            instance.id,
+            *self.update_ingredients_in_recipe(ingredients_data, instance)
+        )
         return super().update(instance, validated_data)
 
     def to_representation(self, instance):
+        request = self.context.get('request')
+        instance = Recipe.objects.with_related().with_user_flags(
+            request.user
+        ).get(id=instance.id)
         serializer = RecipeSerializer(
             instance,
-            context={'request': self.context.get('request')}
+            context={'request': request}
         ).data
         return serializer
-
-
-class CartSerializer(serializers.ModelSerializer):
-    '''Сериализатор модели Cart.'''
-
-    class Meta:
-        model = Cart
-        fields = ['recipe', 'author']
-
-    def validate(self, data):
-        validate_cart_favorite(self.context.get('request'), data, Cart)
-        return super().validate(data)
-
-    def to_representation(self, instance):
-        return SimpleRecipeSerializer(
-            instance.recipe
-        ).data
-
-
-class FavoriteSerializer(serializers.ModelSerializer):
-    '''Сериализатор модели Favorite.'''
-
-    class Meta:
-        model = Favorite
-        fields = ['recipe', 'author']
-
-    def validate(self, data):
-        validate_cart_favorite(self.context.get('request'), data, Favorite)
-        return super().validate(data)
-
-    def to_representation(self, instance):
-        return SimpleRecipeSerializer(
-            instance.recipe
-        ).data
@@ -0,0 +1,164 @@
+from collections import Counter
+from itertools import islice
+
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Sum, Value, When
+
+from api.models import Cart, CartIngredient, IngredientInRecipe
+
+BATCH_SIZE = 1000
+
+
+def get_recipe_amounts(recipe_id):
+    '''Возвращает словарь {id ингредиента: количество} для рецепта.'''
+    return dict(
+        IngredientInRecipe.objects.filter(
+            recipe_id=recipe_id
+        ).values_list('ingredient_id', 'amount')
+    )
+
+
+def apply_cart_delta(author_ids, delta):
+    '''
+    Изменяет суммы ингредиентов в корзинах пользователей на delta.
+
+    delta - словарь {id ингредиента: изменение количества}.
+    Недостающие записи создаются с нулевым количеством, затем все суммы
+    меняются одним UPDATE, а обнулившиеся записи удаляются.
+    '''
+    delta = {
+        ingredient_id: amount
+        for ingredient_id, amount in delta.items() if amount
+    }
+    author_ids = list(author_ids)
+    if not delta or not author_ids:
+        return
+    CartIngredient.objects.bulk_create(
+        [
+            CartIngredient(author_id=author_id, ingredient_id=ingredient_id)
+            for author_id in author_ids
+            for ingredient_id, amount in delta.items() if amount > 0
+        ],
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True
+    )
+    cart_ingredients = CartIngredient.objects.filter(
+        author_id__in=author_ids,
+        ingredient_id__in=delta
+    )
+    cart_ingredients.update(
+        amount=F('amount') + Case(
+            *[
+                When(ingredient_id=ingredient_id, then=Value(amount))
+                for ingredient_id, amount in delta.items()
+            ],
+            default=Value(0),
+            output_field=IntegerField()
+        )
+    )
+    cart_ingredients.filter(amount__lte=0).delete()
+
+
+def add_to_cart_totals(author, recipe_id):
+    '''Учитывает ингредиенты рецепта, добавленного в корзину.'''
+    apply_cart_delta([author.id], get_recipe_amounts(recipe_id))
+
+
+def remove_from_cart_totals(author, recipe_id):
+    '''Вычитает ингредиенты рецепта, удалённого из корзины.'''
+    apply_cart_delta(
+        [author.id],
+        {
+            ingredient_id: -amount
+            for ingredient_id, amount in get_recipe_amounts(recipe_id).items()
+        }
+    )
+
+
+def update_recipe_cart_totals(recipe_id, old_amounts, new_amounts):
+    '''
+    Переносит изменение ингредиентов рецепта в корзины пользователей.
+
+    old_amounts и new_amounts - словари {id ингредиента: количество}
+    до и после изменения рецепта.
+    '''
+    delta = Counter(new_amounts)
+    delta.subtract(old_amounts)
+    if not any(delta.values()):
+        return
+    apply_cart_delta(
+        Cart.objects.filter(
+            recipe_id=recipe_id
+        ).values_list('author_id', flat=True),
+        delta
+    )
+
+
+def get_expected_cart_totals(author_ids=None):
+    '''Вычисляет суммы ингредиентов в корзинах по таблице Cart.'''
+    if author_ids is None:
+        ingredients = IngredientInRecipe.objects.filter(
+            recipe__carts__isnull=False
+        )
+    else:
+        ingredients = IngredientInRecipe.objects.filter(
+            recipe__carts__author_id__in=author_ids
+        )
+    return ingredients.values_list(
+        'recipe__carts__author_id', 'ingredient_id'
+    ).annotate(
+        total=Sum('amount')
+    ).order_by()
+
+
+def rebuild_cart_totals(author_ids=None):
+    '''Полностью пересчитывает суммы ингредиентов в корзинах.'''
+    cart_ingredients = CartIngredient.objects.all()
+    if author_ids is not None:
+        cart_ingredients = cart_ingredients.filter(author_id__in=author_ids)
+    totals = (
+        CartIngredient(
+            author_id=author_id,
+            ingredient_id=ingredient_id,
+            amount=total
+        )
+        for author_id, ingredient_id, total
+        in get_expected_cart_totals(author_ids).iterator()
+    )
+    with transaction.atomic():
+        cart_ingredients.delete()
+        batch = list(islice(totals, BATCH_SIZE))
+        while batch:
+            CartIngredient.objects.bulk_create(batch)
+            batch = list(islice(totals, BATCH_SIZE))
+
+
+def check_cart_totals(author_ids=None):
+    '''
+    Сверяет сохранённые суммы ингредиентов с таблицей Cart.
+
+    Возвращает список кортежей (id пользователя, id ингредиента,
+    сохранённое количество, ожидаемое количество) для расхождений.
+    '''
+    cart_ingredients = CartIngredient.objects.all()
+    if author_ids is not None:
+        cart_ingredients = cart_ingredients.filter(author_id__in=author_ids)
+    actual = {
+        (author_id, ingredient_id): amount
+        for author_id, ingredient_id, amount
+        in cart_ingredients.values_list(
+            'author_id', 'ingredient_id', 'amount'
+        ).iterator()
+    }
+    mismatches = []
+    for author_id, ingredient_id, total in get_expected_cart_totals(
+        author_ids
+    ).iterator():
+        amount = actual.pop((author_id, ingredient_id), 0)
+        if amount != total:
+            mismatches.append((author_id, ingredient_id, amount, total))
+    mismatches.extend(
+        (author_id, ingredient_id, amount, 0)
+        for (author_id, ingredient_id), amount in actual.items()
+    )
+    return mismatches
@@ -0,0 +1,98 @@
+import logging
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from api.catalog import INGREDIENTS, TAGS, bump_catalog_version
+from api.counters import change_counter
+from api.models import Cart, Favorite, Ingredient, Recipe, Tag
+from users.models import User
+from utils.images import create_renditions, delete_renditions
+
+logger = logging.getLogger(__name__)
+
+
+@receiver([post_save, post_delete], sender=Tag)
+def invalidate_tags(sender, **kwargs):
+    '''
+    Сбрасывает кэш справочника тэгов после фиксации транзакции.
+
+    Если сменить версию до фиксации, параллельный запрос может
+    сохранить под новой версией ещё не изменённые данные.
+    '''
+    transaction.on_commit(lambda: bump_catalog_version(TAGS))
+
+
+@receiver([post_save, post_delete], sender=Ingredient)
+def invalidate_ingredients(sender, **kwargs):
+    '''Сбрасывает кэш справочника ингредиентов после фиксации транзакции.'''
+    transaction.on_commit(lambda: bump_catalog_version(INGREDIENTS))
+
+
+@receiver(post_save, sender=Recipe)
+def update_recipe_search_fields(sender, instance, **kwargs):
+    '''
+    Пересчитывает поля поиска сохранённого рецепта.
+
+    Ингредиенты нового рецепта создаются после его сохранения,
+    поэтому при их изменении поля нужно пересчитать отдельно.
+    '''
+    Recipe.objects.filter(id=instance.id).update_search_fields()
+
+
+@receiver(post_save, sender=Ingredient)
+def update_ingredient_recipes_search_vector(sender, instance, created,
+                                            **kwargs):
+    '''Пересчитывает поисковые векторы рецептов с изменённым ингредиентом.'''
+    if not created:
+        Recipe.objects.filter(ingredients=instance).update_search_fields()
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=Cart)
+def increase_recipe_counter(sender, instance, created, **kwargs):
+    '''
+    Увеличивает счётчик рецепта при добавлении в избранное или корзину.
+
+    Запросы API изменяют счётчик в том же SQL-запросе, что и запись,
+    сигнал покрывает остальные пути: админку, shell, фикстуры.
+    Обработчиков post_delete нет, чтобы Django удалял строки
+    при каскадном удалении одним запросом: при удалении счётчики
+    уменьшают API и админка, остальное исправляет reconcile_counters.
+    '''
+    if created:
+        change_counter(Recipe, instance.recipe_id, sender.recipe_counter, 1)
+
+
+@receiver(post_save, sender=Recipe)
+def increase_recipes_count(sender, instance, created, **kwargs):
+    '''Увеличивает счётчик рецептов автора.'''
+    if created:
+        change_counter(User, instance.author_id, 'recipes_count', 1)
+
+
+@receiver(post_save, sender=Recipe)
+def update_image_renditions(sender, instance, **kwargs):
+    '''
+    Создаёт уменьшенные копии новой картинки рецепта.
+
+    Копии пересоздаются, только если картинка сменилась,
+    после чего файлы прежних копий удаляются. Если файл картинки
+    отсутствует или не читается, ошибка записывается в лог,
+    а копии остаются пустыми.
+    '''
+    renditions = instance.image_renditions
+    if not instance.image or renditions.get('source') == instance.image.name:
+        return
+    try:
+        instance.image_renditions = create_renditions(instance.image)
+    except (OSError, ValueError):
+        logger.exception(
+            'Не удалось создать копии картинки рецепта %s.', instance.id
+        )
+        instance.image_renditions = {}
+    Recipe.objects.filter(id=instance.id).update(
+        image_renditions=instance.image_renditions
+    )
+    delete_renditions(instance.image.storage, renditions)
@@ -0,0 +1,486 @@
+import threading
+
+import numpy as np
+from django.core.cache import cache
+from django.db import DatabaseError, connection, transaction
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from api.catalog import get_tag_ids
+from api.filters import IngredientFilter
+from api.models import (Cart, CartIngredient, Favorite, Ingredient,
+                        IngredientInRecipe, Recipe, Tag)
+from api.recommendations import get_incidence_matrix
+from users.models import Follow, User
+from utils.pagination import KeysetPagination
+
+
+def create_user(number):
+    return User.objects.create_user(
+        email=f'user{number}@example.com',
+        username=f'user{number}',
+        first_name='Имя',
+        last_name='Фамилия',
+        password='password-12345'
+    )
+
+
+def create_recipe(author, tags, ingredients):
+    '''Создаёт рецепт с тэгами и ингредиентами.'''
+    recipe = Recipe.objects.create(
+        author=author,
+        name=f'Рецепт {author.username}',
+        text='Описание',
+        cooking_time=10
+    )
+    recipe.tags.set(tags)
+    IngredientInRecipe.objects.bulk_create(
+        IngredientInRecipe(recipe=recipe, ingredient=ingredient, amount=1)
+        for ingredient in ingredients
+    )
+    return recipe
+
+
+class QueryCountTestCase(TestCase):
+    '''Общие данные для тестов количества запросов к спискам.'''
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user(0)
+        cls.authors = [create_user(number) for number in range(1, 13)]
+        Follow.objects.bulk_create(
+            Follow(user=cls.user, following=author)
+            for author in cls.authors[::2]
+        )
+        cls.tags = [
+            Tag.objects.create(
+                name=f'Тэг {number}',
+                slug=f'tag{number}',
+                color=f'#00000{number}'
+            )
+            for number in range(3)
+        ]
+        cls.ingredients = [
+            Ingredient.objects.create(
+                name=f'Ингредиент {number}', measurement_unit='г'
+            )
+            for number in range(10)
+        ]
+        for number, author in enumerate(cls.authors):
+            create_recipe(
+                author, cls.tags[:number % 3 + 1], cls.ingredients[:2]
+            )
+
+    def setUp(self):
+        cache.clear()
+        get_tag_ids()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def get_queries_count(self, url, method='get', status_code=200):
+        with CaptureQueriesContext(connection) as context:
+            response = getattr(self.client, method)(url)
+        self.assertEqual(response.status_code, status_code)
+        return len(context.captured_queries)
+
+
+class SubscriptionQueryCountTest(QueryCountTestCase):
+    '''Признак подписки вычисляется без запроса на каждого автора.'''
+
+    def test_users_list(self):
+        for limit in (2, 12):
+            with self.subTest(limit=limit), self.assertNumQueries(2):
+                response = self.client.get(f'/api/users/?limit={limit}')
+                self.assertEqual(len(response.data['results']), limit)
+
+    def test_users_list_is_subscribed(self):
+        response = self.client.get('/api/users/?limit=13')
+        following = {author.id for author in self.authors[::2]}
+        for user in response.data['results']:
+            self.assertEqual(user['is_subscribed'], user['id'] in following)
+
+    def test_subscriptions_recipes_fields(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get('/api/users/subscriptions/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            len(response.data['results'][0]['recipes']), 1
+        )
+        for query in context.captured_queries:
+            self.assertNotIn('search_vector', query['sql'])
+
+    def test_recipes_list(self):
+        for limit in (2, 12):
+            with self.subTest(limit=limit), self.assertNumQueries(5):
+                response = self.client.get(f'/api/recipes/?limit={limit}')
+                self.assertEqual(len(response.data['results']), limit)
+
+    def test_recipes_list_is_subscribed(self):
+        response = self.client.get('/api/recipes/?limit=12')
+        following = {author.id for author in self.authors[::2]}
+        for recipe in response.data['results']:
+            self.assertEqual(
+                recipe['author']['is_subscribed'],
+                recipe['author']['id'] in following
+            )
+
+
+class RecipePrefetchQueryCountTest(QueryCountTestCase):
+    '''
+    Количество запросов к рецептам не зависит от размера страницы
+    и количества ингредиентов.
+    '''
+
+    def add_ingredients(self, recipes):
+        IngredientInRecipe.objects.bulk_create(
+            IngredientInRecipe(recipe=recipe, ingredient=ingredient, amount=1)
+            for recipe in recipes
+            for ingredient in self.ingredients[2:]
+        )
+
+    def test_list_page_size(self):
+        counts = {
+            limit: self.get_queries_count(f'/api/recipes/?limit={limit}')
+            for limit in (1, 2, 6, 12)
+        }
+        self.assertEqual(len(set(counts.values())), 1, counts)
+
+    def test_list_ingredients_count(self):
+        url = '/api/recipes/?limit=12'
+        count = self.get_queries_count(url)
+        self.add_ingredients(Recipe.objects.all())
+        self.assertEqual(self.get_queries_count(url), count)
+
+    def test_detail_ingredients_count(self):
+        recipe = Recipe.objects.first()
+        url = f'/api/recipes/{recipe.id}/'
+        count = self.get_queries_count(url)
+        self.add_ingredients([recipe])
+        self.assertEqual(self.get_queries_count(url), count)
+        response = self.client.get(url)
+        self.assertEqual(
+            len(response.data['ingredients']), len(self.ingredients)
+        )
+
+    def test_favorite_and_cart_response(self):
+        first, second = Recipe.objects.all()[:2]
+        self.add_ingredients([second])
+        for action in ('favorite', 'shopping_cart'):
+            with self.subTest(action=action):
+                self.assertEqual(
+                    self.get_queries_count(
+                        f'/api/recipes/{first.id}/{action}/', 'post', 201
+                    ),
+                    self.get_queries_count(
+                        f'/api/recipes/{second.id}/{action}/', 'post', 201
+                    )
+                )
+
+
+class CatalogCacheTest(QueryCountTestCase):
+    '''Кэш справочника сбрасывается после фиксации транзакции.'''
+
+    def test_tag_created_in_transaction(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            tag = Tag.objects.create(
+                name='Новый тэг', slug='new', color='#000010'
+            )
+            self.assertNotIn(tag.slug, get_tag_ids())
+        self.assertEqual(get_tag_ids()[tag.slug], tag.id)
+
+
+class IncidenceMatrixTest(SimpleTestCase):
+    '''Пары рецептов, которых нет в списке рецептов, пропускаются.'''
+
+    def test_unknown_recipes(self):
+        matrix = get_incidence_matrix(
+            np.array([1, 2, 3, 5]),
+            np.array([1, 4, 5, 6, 3]),
+            np.array([10, 20, 10, 30, 20])
+        )
+        self.assertEqual(matrix.shape[0], 4)
+        self.assertEqual(
+            matrix.toarray().tolist(),
+            [[1, 0], [0, 0], [0, 1], [1, 0]]
+        )
+
+
+class QueryPlanTestCase(QueryCountTestCase):
+    '''
+    Проверка планов запросов.
+
+    В тестовой базе мало строк, поэтому последовательное сканирование
+    отключается, и планировщик выбирает индекс, если условие
+    запроса позволяет его использовать.
+    '''
+
+    def setUp(self):
+        super().setUp()
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+
+    def get_plan(self, queryset):
+        return queryset.explain()
+
+
+class KeysetPaginationPlanTest(QueryPlanTestCase):
+    '''Условие курсора используется как условие поиска по индексу.'''
+
+    def get_page_queryset(self, ordering):
+        paginator = KeysetPagination()
+        paginator.ordering = ordering
+        queryset = Recipe.objects.order_by(*ordering)
+        last = queryset[5]
+        cursor = [getattr(last, field.lstrip('-')) for field in ordering]
+        return queryset.filter(paginator.get_keyset_filter(cursor))
+
+    def test_same_direction(self):
+        orderings = {
+            'recipe_pub_date_id_idx': ['-pub_date', '-id'],
+            'recipe_favorites_id_idx': ['-favorites_count', '-id'],
+            'recipe_cooking_time_id_idx': ['cooking_time', 'id'],
+        }
+        for index, ordering in orderings.items():
+            with self.subTest(ordering=ordering):
+                plan = self.get_plan(self.get_page_queryset(ordering))
+                self.assertIn(index, plan)
+                self.assertRegex(plan, r'Index Cond: \(ROW\(')
+                self.assertEqual(
+                    self.get_page_queryset(ordering).count(),
+                    len(self.authors) - 6
+                )
+
+    def test_mixed_direction(self):
+        ordering = ['cooking_time', '-id']
+        plan = self.get_plan(self.get_page_queryset(ordering))
+        self.assertIn('recipe_cooking_time_id_idx', plan)
+        self.assertIn('Index Cond: (cooking_time >=', plan)
+        self.assertEqual(
+            self.get_page_queryset(ordering).count(), len(self.authors) - 6
+        )
+
+
+class IngredientSearchPlanTest(QueryPlanTestCase):
+    '''
+    Поиск ингредиентов использует индексы из миграции 0009.
+
+    Индексы создаются в тесте, если их нет в тестовой базе.
+    Триграммный индекс проверяется, только если доступно
+    расширение pg_trgm.
+    '''
+
+    prefix_index = 'api_ingredient_name_upper_prefix_idx'
+    trgm_index = 'api_ingredient_name_upper_trgm_idx'
+
+    def setUp(self):
+        super().setUp()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'CREATE INDEX IF NOT EXISTS {self.prefix_index} '
+                'ON api_ingredient (UPPER(name::text) text_pattern_ops)'
+            )
+
+    def search(self, value):
+        return IngredientFilter(
+            {'name': value}, queryset=Ingredient.objects.all()
+        ).qs
+
+    def test_prefix(self):
+        Ingredient.objects.bulk_create([
+            Ingredient(name='болгарский перец', measurement_unit='г'),
+            Ingredient(name='перец', measurement_unit='г'),
+        ])
+        self.assertEqual(
+            [ingredient.name for ingredient in self.search('Перец')],
+            ['перец', 'болгарский перец']
+        )
+        self.assertIn(
+            f'Index Scan using {self.prefix_index}',
+            self.get_plan(self.search('Перец'))
+        )
+
+    def test_substring(self):
+        try:
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+                cursor.execute(
+                    f'CREATE INDEX IF NOT EXISTS {self.trgm_index} '
+                    'ON api_ingredient '
+                    'USING gin (UPPER(name::text) gin_trgm_ops)'
+                )
+        except DatabaseError:
+            self.skipTest('Расширение pg_trgm недоступно.')
+        self.assertIn(
+            f'Bitmap Index Scan on {self.trgm_index}',
+            self.get_plan(self.search('диент'))
+        )
+
+
+class UserFlagsPlanTest(QueryPlanTestCase):
+    '''Признаки избранного и корзины используют уникальные индексы.'''
+
+    models = {'unique_favorite': Favorite, 'unique_cart': Cart}
+
+    def test_user_flags_subqueries(self):
+        plan = self.get_plan(
+            Recipe.objects.with_user_flags(self.user)[:6]
+        )
+        for index in self.models:
+            with self.subTest(index=index):
+                self.assertRegex(
+                    plan, rf'Index (Only )?Scan on {index}\b'
+                )
+
+    def test_lookup(self):
+        recipe = Recipe.objects.first()
+        for index, model in self.models.items():
+            with self.subTest(index=index):
+                plan = self.get_plan(
+                    model.objects.filter(author=self.user, recipe=recipe)
+                )
+                self.assertRegex(
+                    plan,
+                    rf'Index (Only )?Scan using {index} .*\n.*'
+                    rf'Index Cond: \(\(author_id = {self.user.id}\) '
+                    rf'AND \(recipe_id = {recipe.id}\)\)'
+                )
+
+
+class ConcurrentRequestsTest(TransactionTestCase):
+    '''
+    Параллельные запросы, изменяющие счётчики.
+
+    Каждый поток выполняет запрос через собственное соединение с базой,
+    запросы стартуют одновременно.
+    '''
+
+    threads_count = 8
+
+    def setUp(self):
+        self.users = [create_user(number) for number in range(3)]
+        self.ingredients = [
+            Ingredient.objects.create(
+                name=f'Ингредиент {number}', measurement_unit='г'
+            )
+            for number in range(3)
+        ]
+        self.recipes = [
+            create_recipe(self.users[0], [], self.ingredients)
+            for _ in range(self.threads_count)
+        ]
+
+    def send_parallel(self, requests):
+        '''
+        Одновременно выполняет запросы (пользователь, метод, url)
+        и возвращает коды ответов.
+        '''
+        barrier = threading.Barrier(len(requests))
+        statuses = []
+
+        def send(user, method, url):
+            client = APIClient()
+            client.force_authenticate(user)
+            try:
+                barrier.wait()
+                statuses.append(getattr(client, method)(url).status_code)
+            finally:
+                connection.close()
+
+        threads = [
+            threading.Thread(target=send, args=request)
+            for request in requests
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return sorted(statuses)
+
+    def assert_single_success(self, method, url, status_code):
+        statuses = self.send_parallel(
+            [(self.users[0], method, url)] * self.threads_count
+        )
+        self.assertEqual(
+            statuses, [status_code] + [400] * (self.threads_count - 1)
+        )
+
+    def test_favorite(self):
+        recipe = self.recipes[0]
+        url = f'/api/recipes/{recipe.id}/favorite/'
+        self.assert_single_success('post', url, 201)
+        self.assertEqual(Favorite.objects.filter(recipe=recipe).count(), 1)
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.favorites_count, 1)
+        self.assert_single_success('delete', url, 204)
+        self.assertFalse(Favorite.objects.exists())
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.favorites_count, 0)
+
+    def test_favorite_many_users(self):
+        recipe = self.recipes[0]
+        statuses = self.send_parallel([
+            (user, 'post', f'/api/recipes/{recipe.id}/favorite/')
+            for user in self.users
+        ])
+        self.assertEqual(statuses, [201] * len(self.users))
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.favorites_count, len(self.users))
+
+    def test_shopping_cart(self):
+        recipe = self.recipes[0]
+        url = f'/api/recipes/{recipe.id}/shopping_cart/'
+        self.assert_single_success('post', url, 201)
+        self.assertEqual(Cart.objects.filter(recipe=recipe).count(), 1)
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.carts_count, 1)
+        self.assertEqual(
+            set(CartIngredient.objects.values_list('ingredient', 'amount')),
+            {(ingredient.id, 1) for ingredient in self.ingredients}
+        )
+        self.assert_single_success('delete', url, 204)
+        self.assertFalse(Cart.objects.exists())
+        self.assertFalse(CartIngredient.objects.exists())
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.carts_count, 0)
+
+    def test_shopping_cart_different_recipes(self):
+        statuses = self.send_parallel([
+            (self.users[1], 'post', f'/api/recipes/{recipe.id}/shopping_cart/')
+            for recipe in self.recipes
+        ])
+        self.assertEqual(statuses, [201] * self.threads_count)
+        self.assertEqual(
+            set(CartIngredient.objects.values_list('ingredient', 'amount')),
+            {
+                (ingredient.id, self.threads_count)
+                for ingredient in self.ingredients
+            }
+        )
+
+    def test_unsubscribe(self):
+        author = self.users[0]
+        url = f'/api/users/{author.id}/subscribe/'
+        client = APIClient()
+        client.force_authenticate(self.users[1])
+        self.assertEqual(client.post(url).status_code, 201)
+        client.force_authenticate(self.users[2])
+        self.assertEqual(client.post(url).status_code, 201)
+        self.send_parallel(
+            [(self.users[1], 'delete', url)] * self.threads_count
+        )
+        author.refresh_from_db()
+        self.assertEqual(author.followers_count, 1)
+        self.assertEqual(Follow.objects.filter(following=author).count(), 1)
+
+    def test_recipe_delete(self):
+        author = self.users[0]
+        author.refresh_from_db()
+        recipes_count = author.recipes_count
+        statuses = self.send_parallel(
+            [(author, 'delete', f'/api/recipes/{self.recipes[0].id}/')]
+            * self.threads_count
+        )
+        self.assertIn(204, statuses)
+        author.refresh_from_db()
+        self.assertEqual(author.recipes_count, recipes_count - 1)
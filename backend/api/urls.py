@@ -1,9 +1,12 @@
+from django.conf import settings
 from django.urls import include, path
-from djoser.views import TokenCreateView, TokenDestroyView
+from djoser.views import TokenDestroyView
 from rest_framework import routers
 
 from api.views import IngredientViewSet, RecipeViewSet, TagViewSet
-from users.views import UserView
+from users.views import (JWTTokenCreateView, JWTTokenDestroyView,
+                         JWTTokenRefreshView, ThrottledTokenCreateView,
+                         UserView)
 
 router = routers.DefaultRouter()
 router.register('users', UserView)
@@ -15,6 +18,16 @@ urlpatterns = [
     path('', include(router.urls)),
     path('users/', UserView),
     path('', include('djoser.urls')),
-    path('auth/token/login/', TokenCreateView.as_view()),
-    path('auth/token/logout/', TokenDestroyView.as_view()),
 ]
+
+if settings.AUTH_MODE == 'jwt':
+    urlpatterns += [
+        path('auth/token/login/', JWTTokenCreateView.as_view()),
+        path('auth/token/refresh/', JWTTokenRefreshView.as_view()),
+        path('auth/token/logout/', JWTTokenDestroyView.as_view()),
+    ]
+else:
+    urlpatterns += [
+        path('auth/token/login/', ThrottledTokenCreateView.as_view()),
+        path('auth/token/logout/', TokenDestroyView.as_view()),
+    ]
@@ -1,20 +1,34 @@
-from django.db.models import Exists, OuterRef, Sum
-from django.http import HttpResponse
-from django.shortcuts import get_object_or_404
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.core.handlers.asgi import ASGIRequest
+from django.db import transaction
+from django.db.models import F, Sum
+from django.http import StreamingHttpResponse
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import status
 from rest_framework.decorators import action
+from rest_framework.generics import get_object_or_404
 from rest_framework.permissions import (SAFE_METHODS, AllowAny,
+                                        IsAuthenticated,
                                         IsAuthenticatedOrReadOnly)
 from rest_framework.response import Response
 from rest_framework.viewsets import ModelViewSet, ReadOnlyModelViewSet
 
+from api.catalog import INGREDIENTS, TAGS, catalog_response
+from api.counters import change_counter
 from api.filters import IngredientFilter, RecipeFilter
-from api.models import Cart, Favorite, Ingredient, Recipe, Tag
+from api.models import Cart, CartIngredient, Favorite, Ingredient, Recipe, Tag
 from api.permissions import IsAuthor
-from api.serializers import (CartSerializer, FavoriteSerializer,
-                             IngredientSerializer, RecipeAddSerializer,
-                             RecipeSerializer, TagSerializer)
+from api.serializers import (IngredientSerializer, RecipeAddSerializer,
+                             RecipeCoverageSerializer, RecipeSerializer,
+                             TagSerializer)
+from api.shopping_cart import (add_to_cart_totals, get_recipe_amounts,
+                               remove_from_cart_totals,
+                               update_recipe_cart_totals)
+from users.models import Follow, User
+from utils.pagination import KeysetPagination
+from utils.serializers import SimpleRecipeSerializer
+from utils.shopping_list import SHOPPING_LIST_FORMATS
 from utils.views import response_400, response_404_recipe
 
 
@@ -25,6 +39,12 @@ class TagViewSet(ReadOnlyModelViewSet):
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
 
+    def list(self, request, *args, **kwargs):
+        return catalog_response(
+            request, TAGS, '',
+            lambda: self.get_serializer(self.get_queryset(), many=True).data
+        )
+
 
 class IngredientViewSet(ReadOnlyModelViewSet):
 
@@ -36,110 +56,253 @@ class IngredientViewSet(ReadOnlyModelViewSet):
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
 
+    def list(self, request, *args, **kwargs):
+        return catalog_response(
+            request, INGREDIENTS,
+            request.query_params.get('name', '').strip().lower(),
+            lambda: self.get_serializer(
+                self.filter_queryset(self.get_queryset()), many=True
+            ).data
+        )
+
 
 class RecipeViewSet(ModelViewSet):
 
     filter_backends = [DjangoFilterBackend]
     filterset_class = RecipeFilter
     permission_classes = [IsAuthenticatedOrReadOnly, IsAuthor]
+    keyset_actions = ('list',)
 
     def get_queryset(self):
-        queryset = Recipe.objects.select_related(
-            'author'
-        ).prefetch_related(
-            'ingredients'
-        )
-        if not self.request.user.is_authenticated:
-            return queryset.all()
-        return (
-            queryset.annotate(
-                is_favorited=Exists(
-                    Favorite.objects.filter(
-                        recipe=OuterRef('id'),
-                        author=self.request.user
-                    )
-                ),
-                is_in_shopping_cart=Exists(
-                    Cart.objects.filter(
-                        recipe=OuterRef('id'),
-                        author=self.request.user
-                    )
-                )
-            ).all()
-        )
+        queryset = Recipe.objects.with_user_flags(self.request.user)
+        if self.request.method in SAFE_METHODS:
+            return queryset.with_related()
+        return queryset
+
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            update_recipe_cart_totals(
+                instance.id, get_recipe_amounts(instance.id), {}
+            )
+            _, deleted = instance.delete()
+            if deleted.get(Recipe._meta.label):
+                change_counter(User, instance.author_id, 'recipes_count', -1)
 
     def get_serializer_class(self):
         if self.request.method in SAFE_METHODS:
             return RecipeSerializer
         return RecipeAddSerializer
 
-    def get_shopping_cart_queryset(self, shopping_list):
-        '''Возвращает ответ со списокм покупок.'''
-        response = HttpResponse(content_type='text/plain')
-        response['Content-Disposition'] = (
-            'attachment; filename="shopping_list.txt"'
+    @action(
+        ['GET'], detail=False, name='feed',
+        permission_classes=[IsAuthenticated]
+    )
+    def feed(self, request):
+        '''
+        Возвращает ленту рецептов авторов, на которых подписан пользователь.
+
+        Рецепты выбираются одним запросом с подзапросом к подпискам
+        по индексу (author, pub_date) и разбиваются на страницы по курсору,
+        поэтому глубина листания не влияет на время ответа.
+        '''
+        queryset = self.filter_queryset(self.get_queryset()).filter(
+            author__in=Follow.objects.filter(
+                user=request.user
+            ).values('following_id')
         )
-        for ingredient in shopping_list:
-            response.write(
-                f'{ingredient["ingredients__name"]}: '
-                f'{ingredient["amount"]}'
-                f'{ingredient["ingredients__measurement_unit"]}\n'
+        paginator = KeysetPagination()
+        page = paginator.paginate_queryset(queryset, request, self)
+        serializer = self.get_serializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
+    @action(['GET'], detail=True, name='similar')
+    def similar(self, request, pk):
+        '''
+        Возвращает рецепты, похожие на данный.
+
+        Похожие рецепты заранее рассчитываются командой
+        build_recipe_neighbors и выбираются по сохранённой оценке.
+        '''
+        recipe = get_object_or_404(Recipe.objects.only('id'), id=pk)
+        queryset = self.get_queryset().filter(
+            neighbor_of__recipe=recipe
+        ).order_by('-neighbor_of__score', '-id')
+        page = self.paginate_queryset(queryset)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    @action(
+        ['GET'], detail=False, name='recommended',
+        permission_classes=[IsAuthenticated]
+    )
+    def recommended(self, request):
+        '''
+        Возвращает рекомендации по избранному пользователя.
+
+        Оценка рецепта - сумма его сходства с рецептами из избранного;
+        уже добавленные в избранное рецепты не рекомендуются.
+        Если избранное пусто, возвращаются популярные рецепты.
+        '''
+        queryset = self.get_queryset().exclude(
+            favorites__author=request.user
+        )
+        if Favorite.objects.filter(author=request.user).exists():
+            queryset = queryset.filter(
+                neighbor_of__recipe__favorites__author=request.user
+            ).annotate(
+                recommendation_score=Sum('neighbor_of__score')
+            ).order_by('-recommendation_score', '-id')
+        else:
+            queryset = queryset.order_by('-favorites_count', '-id')
+        page = self.paginate_queryset(queryset)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    @action(['GET'], detail=False, name='search')
+    def search(self, request):
+        '''
+        Полнотекстовый поиск рецептов по параметру q.
+
+        Запрос разбирается в синтаксисе веб-поиска, рецепты выбираются
+        по GIN-индексу поискового вектора и сортируются по релевантности.
+        '''
+        text = request.query_params.get('q', '').strip()
+        if not text:
+            return response_400('Не задан поисковый запрос q.')
+        query = SearchQuery(
+            text, config=settings.SEARCH_CONFIG, search_type='websearch'
+        )
+        queryset = self.get_queryset().filter(
+            search_vector=query
+        ).annotate(
+            rank=SearchRank(F('search_vector'), query)
+        ).order_by('-rank', '-id')
+        page = self.paginate_queryset(queryset)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    @action(['GET'], detail=False, name='by-ingredients')
+    def by_ingredients(self, request):
+        '''
+        Подбирает рецепты по имеющимся ингредиентам.
+
+        id ингредиентов передаются параметром ingredients, который можно
+        указать несколько раз. Рецепты сортируются по доле имеющихся
+        ингредиентов, затем по количеству недостающих.
+        '''
+        try:
+            ingredient_ids = {
+                int(ingredient_id)
+                for ingredient_id in request.query_params.getlist(
+                    'ingredients'
+                )
+            }
+        except ValueError:
+            return response_400('id ингредиентов должны быть числами.')
+        if not ingredient_ids:
+            return response_400('Не заданы ингредиенты.')
+        if len(ingredient_ids) > settings.MAX_AVAILABLE_INGREDIENTS:
+            return response_400(
+                'Слишком много ингредиентов. Максимум: '
+                f'{settings.MAX_AVAILABLE_INGREDIENTS}.'
             )
-        return response
+        queryset = self.get_queryset().with_ingredient_coverage(
+            ingredient_ids
+        ).order_by('-coverage', 'missing_count', '-id')
+        page = self.paginate_queryset(queryset)
+        serializer = RecipeCoverageSerializer(
+            page, many=True, context=self.get_serializer_context()
+        )
+        return self.get_paginated_response(serializer.data)
 
-    @action(['GET'], detail=False, name='download-shopping-cart')
+    @action(
+        ['GET'], detail=False, name='download-shopping-cart',
+        permission_classes=[IsAuthenticated]
+    )
     def download_shopping_cart(self, request):
-        '''Подготавлиет к скачиванию файл списк покупок.'''
-        cart_recipes = Cart.objects.filter(
+        '''
+        Подготавлиет к скачиванию файл списк покупок.
+
+        Суммы ингредиентов берутся из таблицы CartIngredient, которая
+        обновляется при изменении корзины, а строки ответа формируются
+        по мере чтения результата из базы.
+        Формат файла задаётся параметром file_format: txt, csv или json.
+        '''
+        file_format = request.query_params.get('file_format', 'txt')
+        if file_format not in SHOPPING_LIST_FORMATS:
+            return response_400(
+                'Неподдерживаемый формат файла. Доступные форматы: '
+                f'{", ".join(SHOPPING_LIST_FORMATS)}.'
+            )
+        content_type, render = SHOPPING_LIST_FORMATS[file_format]
+        ingredients_amount = CartIngredient.objects.filter(
             author=request.user
-        ).values_list('recipe', flat=True)
-        ingredients_amount = Recipe.objects.filter(
-            id__in=cart_recipes
-        ).prefetch_related(
-            'ingredients'
         ).values(
-            'ingredients__name',
-            'ingredients__measurement_unit'
-        ).annotate(
-            amount=Sum('ingredient_recipes__amount')
-        ).order_by('ingredients__name')
-        return self.get_shopping_cart_queryset(ingredients_amount)
-
-    def post_delete_favorite_cart(self, request, pk, model, serializer):
-        '''Подготавливает данные для сериализаторов модели Cart и Favortie.'''
-        METHODS_RESPONSE = {
-            'POST': response_400('Несуществующий рецепт.'),
-            'DELETE': response_404_recipe('Несуществующий рецепт.')
-        }
-        try:
-            recipe = Recipe.objects.get(id=pk)
-        except Recipe.DoesNotExist:
-            return METHODS_RESPONSE.get(request.method)
-        data = {'recipe': recipe.id, 'author': request.user.id}
-        serializer = serializer(
-            data=data,
-            context={'request': request}
+            'amount',
+            name=F('ingredient__name'),
+            measurement_unit=F('ingredient__measurement_unit')
+        ).order_by('name')
+        ingredients_amount = ingredients_amount.iterator()
+        if isinstance(request._request, ASGIRequest):
+            # Под ASGI Django 3.2 перебирает потоковый ответ в цикле
+            # событий, где запросы к базе запрещены.
+            ingredients_amount = list(ingredients_amount)
+        response = StreamingHttpResponse(
+            render(ingredients_amount),
+            content_type=f'{content_type}; charset=utf-8'
         )
-        if request.method == 'POST':
-            serializer.is_valid(raise_exception=True)
-            serializer.save()
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
-        serializer.is_valid(raise_exception=True)
-        get_object_or_404(
-            model,
-            recipe=recipe.id,
-            author=request.user
-        ).delete()
+        response['Content-Disposition'] = (
+            f'attachment; filename="shopping_list.{file_format}"'
+        )
+        return response
+
+    def post_delete_favorite_cart(self, request, pk, model):
+        '''
+        Добавляет рецепт в модель Cart или Favorite либо удаляет его оттуда.
+
+        Изменение выполняется одним запросом к базе, а существование
+        рецепта проверяется только для выбора ответа с ошибкой.
+        '''
+        try:
+            recipe_id = int(pk)
+        except ValueError:
+            return self.favorite_cart_error(request, None, model)
+        with transaction.atomic():
+            if request.method == 'POST':
+                recipe = model.objects.add(request.user, recipe_id)
+                if recipe is None:
+                    return self.favorite_cart_error(request, recipe_id, model)
+                if model is Cart:
+                    add_to_cart_totals(request.user, recipe_id)
+                return Response(
+                    SimpleRecipeSerializer(recipe).data,
+                    status=status.HTTP_201_CREATED
+                )
+            if not model.objects.remove(request.user, recipe_id):
+                return self.favorite_cart_error(request, recipe_id, model)
+            if model is Cart:
+                remove_from_cart_totals(request.user, recipe_id)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
+    def favorite_cart_error(self, request, recipe_id, model):
+        '''Возвращает ответ с ошибкой изменения Cart или Favorite.'''
+        if (
+            recipe_id is None
+            or not Recipe.objects.filter(id=recipe_id).exists()
+        ):
+            if request.method == 'POST':
+                return response_400('Несуществующий рецепт.')
+            return response_404_recipe('Несуществующий рецепт.')
+        if request.method == 'POST':
+            return response_400('Нельзя добавить дважды один и тот же объект')
+        return response_400(
+            f'Не существует такого объекта модели {model.__name__}'
+        )
+
     @action(['POST', 'DELETE'], detail=True, name='shopping-cart')
     def shopping_cart(self, request, pk):
-        return self.post_delete_favorite_cart(
-            request, pk, Cart, CartSerializer
-        )
+        return self.post_delete_favorite_cart(request, pk, Cart)
 
     @action(['POST', 'DELETE'], detail=True, name='favorite')
     def favorite(self, request, pk):
-        return self.post_delete_favorite_cart(
-            request, pk, Favorite, FavoriteSerializer
-        )
+        return self.post_delete_favorite_cart(request, pk, Favorite)
@@ -1,7 +1,21 @@
 import os
 
+from asgiref.sync import ThreadSensitiveContext
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'foodgram.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+
+async def application(scope, receive, send):
+    '''
+    Обрабатывает запрос в отдельном контексте синхронного кода.
+
+    Django 3.2 выполняет синхронные представления и middleware
+    в одном потоке на процесс, и воркер uvicorn обрабатывает их
+    строго по одному. ThreadSensitiveContext выделяет каждому
+    запросу собственный поток, как это делает Django 4.0.
+    '''
+    async with ThreadSensitiveContext():
+        await django_application(scope, receive, send)
@@ -1,4 +1,5 @@
 import os
+from datetime import timedelta
 from pathlib import Path
 
 from django.core.management.utils import get_random_secret_key
@@ -21,6 +22,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'django_extensions',
     'rest_framework',
     'rest_framework.authtoken',
@@ -73,6 +75,15 @@ DATABASES = {
     }
 }
 
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
+    }
+}
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -89,6 +100,8 @@ AUTH_PASSWORD_VALIDATORS = [
 ]
 
 PAGINATION = 6  # Количество объектов на странице пагинации.
+PAGINATION_EXACT_COUNT_LIMIT = 1000  # До этого значения count точный.
+PAGINATION_COUNT_CACHE_TIMEOUT = 60  # Время хранения count в кэше.
 REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
@@ -100,6 +113,32 @@ REST_FRAMEWORK = {
 
     'DEFAULT_PAGINATION_CLASS': 'utils.pagination.PageLimitPagination',
     'PAGE_SIZE': PAGINATION,
+
+    'DEFAULT_THROTTLE_RATES': {
+        'login_ip': os.getenv('LOGIN_IP_RATE', '100/hour'),
+        'login_email': os.getenv('LOGIN_EMAIL_RATE', '10/hour'),
+    },
+    # Количество прокси перед приложением, для определения IP клиента.
+    'NUM_PROXIES': int(os.getenv('NUM_PROXIES', 1)),
+}
+
+# Режим аутентификации: token - ключи authtoken, jwt - подписанные токены.
+AUTH_MODE = os.getenv('AUTH_MODE', 'token')
+
+if AUTH_MODE == 'jwt':
+    REST_FRAMEWORK['DEFAULT_AUTHENTICATION_CLASSES'].insert(
+        0, 'users.authentication.StatelessJWTAuthentication'
+    )
+
+SIMPLE_JWT = {
+    'ACCESS_TOKEN_LIFETIME': timedelta(
+        minutes=int(os.getenv('JWT_ACCESS_TOKEN_MINUTES', 15))
+    ),
+    'REFRESH_TOKEN_LIFETIME': timedelta(
+        days=int(os.getenv('JWT_REFRESH_TOKEN_DAYS', 7))
+    ),
+    'AUTH_HEADER_TYPES': ('Bearer', 'Token'),
+    'SIGNING_KEY': SECRET_KEY,
 }
 
 DJOSER = {
@@ -145,3 +184,17 @@ MIN_AMOUNT = 1  # Минимальное количество одного ин
 EMAIL_LENGTH = 254  # Максимальная длина почты
 REGULAR_EXP = r'^[\w.@+-]+$'  # Регулярное выражение для username
 FORBIDDEN_USERNAME = 'me'  # username, который нельзя использовать
+INGREDIENT_SEARCH_LIMIT = 50  # Максимум ингредиентов в поиске по названию.
+SEARCH_CONFIG = 'russian'  # Конфигурация полнотекстового поиска Postgres.
+MAX_AVAILABLE_INGREDIENTS = 100  # Максимум ингредиентов в подборе рецептов.
+RECIPE_NEIGHBORS = 20  # Количество сохраняемых похожих рецептов.
+IMAGE_RENDITIONS = {  # Размеры уменьшенных копий изображений рецептов.
+    'detail': (1200, 1200),
+    'list': (480, 480),
+    'preview': (160, 160),
+}
+IMAGE_RENDITION_QUALITY = 80  # Качество сжатия уменьшенных копий.
+CATALOG_CACHE_ALIAS = 'default'  # Кэш справочников тэгов и ингредиентов.
+CATALOG_CACHE_TIMEOUT = 60 * 60  # Время хранения справочников в кэше.
+CATALOG_LOCAL_CACHE_SIZE = 1000  # Количество справочников в памяти процесса.
+CATALOG_LOCAL_VERSION_TIMEOUT = 10  # Срок версии справочника в LocMemCache.
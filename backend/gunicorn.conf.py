@@ -0,0 +1,12 @@
+import os
+
+# Режим сервера: wsgi - синхронные воркеры, asgi - воркеры uvicorn.
+SERVER_MODE = os.getenv('SERVER_MODE', 'wsgi')
+
+bind = '0.0.0.0:9000'
+
+if SERVER_MODE == 'asgi':
+    wsgi_app = 'foodgram.asgi:application'
+    worker_class = 'uvicorn.workers.UvicornWorker'
+else:
+    wsgi_app = 'foodgram.wsgi:application'
@@ -0,0 +1,112 @@
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework import permissions
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.utils import aware_utcnow, datetime_to_epoch
+
+from users.models import User
+
+# Поля пользователя, которые сохраняются в токене.
+TOKEN_USER_FIELDS = ('is_staff', 'is_superuser')
+# Время выпуска токена в миллисекундах для сравнения со временем отзыва.
+ISSUED_AT_CLAIM = 'iat_ms'
+
+
+def get_timestamp_ms(moment):
+    return int(moment.timestamp() * 1000)
+
+
+def get_revoked_token_key(jti):
+    return f'revoked-token:{jti}'
+
+
+def get_revoked_user_key(user_id):
+    return f'revoked-user:{user_id}'
+
+
+def create_tokens(user):
+    '''
+    Возвращает пару токенов (refresh, access) для пользователя.
+
+    Кроме id в токены записываются время выпуска в миллисекундах и поля
+    TOKEN_USER_FIELDS, чтобы пользователя можно было восстановить
+    без запроса к базе.
+    '''
+    refresh = RefreshToken.for_user(user)
+    refresh[ISSUED_AT_CLAIM] = get_timestamp_ms(refresh.current_time)
+    for field in TOKEN_USER_FIELDS:
+        refresh[field] = getattr(user, field)
+    return refresh, refresh.access_token
+
+
+def revoke_token(token):
+    '''Добавляет токен в список отозванных до окончания его действия.'''
+    timeout = token['exp'] - datetime_to_epoch(aware_utcnow())
+    if timeout > 0:
+        cache.set(get_revoked_token_key(token['jti']), True, timeout)
+
+
+def revoke_user_tokens(user_id):
+    '''Отзывает все токены пользователя, выпущенные до текущего момента.'''
+    cache.set(
+        get_revoked_user_key(user_id),
+        get_timestamp_ms(aware_utcnow()),
+        settings.SIMPLE_JWT['REFRESH_TOKEN_LIFETIME'].total_seconds()
+    )
+
+
+def is_revoked(token):
+    '''
+    Проверяет, отозван ли токен.
+
+    Список отозванных хранится в кэше: ключи отдельных токенов по jti
+    и время отзыва всех токенов пользователя. Обе записи читаются
+    одним обращением к кэшу, записи удаляются вместе с истечением
+    срока действия токенов. Время выпуска и отзыва хранится
+    в миллисекундах, поэтому токен, выпущенный сразу после отзыва,
+    остаётся действительным.
+    '''
+    token_key = get_revoked_token_key(token['jti'])
+    user_key = get_revoked_user_key(token['user_id'])
+    revoked = cache.get_many([token_key, user_key])
+    return token_key in revoked or (
+        user_key in revoked
+        and token.get(ISSUED_AT_CLAIM, 0) < revoked[user_key]
+    )
+
+
+class StatelessJWTAuthentication(JWTAuthentication):
+    '''
+    Аутентификация по подписанному токену без запроса к базе.
+
+    Для безопасных методов пользователь восстанавливается из полей
+    токена, для изменяющих запросов загружается из базы, чтобы
+    сохранение и проверка активности работали с актуальными данными.
+    Токены без точек (ключи authtoken) пропускаются, и их проверяет
+    следующий класс аутентификации.
+    '''
+
+    def authenticate(self, request):
+        header = self.get_header(request)
+        if header is None:
+            return None
+        raw_token = self.get_raw_token(header)
+        if raw_token is None or b'.' not in raw_token:
+            return None
+        token = self.get_validated_token(raw_token)
+        if is_revoked(token):
+            raise InvalidToken('Токен отозван.')
+        if request.method in permissions.SAFE_METHODS:
+            return self.get_stateless_user(token), token
+        return self.get_user(token), token
+
+    def get_stateless_user(self, token):
+        user = User(
+            id=token['user_id'],
+            **{field: token.get(field, False) for field in TOKEN_USER_FIELDS}
+        )
+        user._state.adding = False
+        user.is_stateless = True
+        return user
@@ -3,9 +3,10 @@ from django.contrib.auth.models import AbstractUser
 from django.db import models
 
 from users.validators import validate_me, validate_pattern
+from utils.models import CountersModelMixin
 
 
-class User(AbstractUser):
+class User(CountersModelMixin, AbstractUser):
     '''Модель пользователя.'''
 
     USERNAME_FIELD = 'email'
@@ -34,6 +35,16 @@ class User(AbstractUser):
         'Пароль',
         max_length=settings.USERS_CHAR_LENGTH
     )
+    recipes_count = models.PositiveIntegerField(
+        'Количество рецептов',
+        default=0
+    )
+    followers_count = models.PositiveIntegerField(
+        'Количество подписчиков',
+        default=0
+    )
+
+    counter_fields = ('recipes_count', 'followers_count')
 
     class Meta:
         ordering = ('username',)
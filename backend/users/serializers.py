@@ -6,11 +6,37 @@ from djoser.serializers import UserCreateSerializer
 from rest_framework import serializers
 from rest_framework.validators import UniqueValidator
 
-from api.models import Recipe
 from users.models import Follow, User
 from utils.serializers import SimpleRecipeSerializer, raise_validation_error
 
 
+def get_following_ids(request):
+    '''
+    Возвращает множество id авторов, на которых подписан пользователь.
+
+    Множество вычисляется одним запросом и кэшируется на объекте запроса,
+    поэтому все сериализаторы одного ответа используют общий результат.
+    '''
+    following_ids = getattr(request, '_following_ids', None)
+    if following_ids is None:
+        following_ids = set(
+            Follow.objects.filter(
+                user=request.user
+            ).values_list('following_id', flat=True)
+        )
+        request._following_ids = following_ids
+    return following_ids
+
+
+def get_recipes_limit(request):
+    '''Возвращает значение параметра recipes_limit или None.'''
+    try:
+        recipes_limit = int(request.GET.get('recipes_limit'))
+    except (TypeError, ValueError):
+        return None
+    return recipes_limit if recipes_limit >= 0 else None
+
+
 class UserCreateSerializer(UserCreateSerializer):
     '''
     Сериализатор для модели User.
@@ -67,18 +93,22 @@ class TokenCreateSerializer(serializers.Serializer):
         self.fields['email'] = serializers.CharField(required=False)
 
     def validate(self, attrs):
-        password = attrs.get('password')
-        params = {'email': attrs.get('email')}
+        '''
+        Проверяет пароль ровно одним вычислением хэша.
+
+        Для неизвестного email ModelBackend сам вычисляет хэш
+        от фиктивного пароля, поэтому время ответа не выдаёт,
+        существует ли пользователь. Неактивные пользователи
+        authenticate не проходят.
+        '''
         self.user = authenticate(
-            request=self.context.get('request'), **params, password=password
+            request=self.context.get('request'),
+            email=attrs.get('email'),
+            password=attrs.get('password')
         )
         if not self.user:
-            self.user = User.objects.filter(**params).first()
-            if self.user and not self.user.check_password(password):
-                self.fail('invalid_credentials')
-        if self.user and self.user.is_active:
-            return attrs
-        self.fail('invalid_credentials')
+            self.fail('invalid_credentials')
+        return attrs
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -107,48 +137,32 @@ class UserSerializer(serializers.ModelSerializer):
             raise ValidationError(
                 'Неавторизированный пользователь.'
             )
-        return request.user.is_authenticated and Follow.objects.filter(
-            user=request.user,
-            following=obj
-        ).exists()
+        if not request.user.is_authenticated:
+            return False
+        is_subscribed = getattr(obj, 'is_subscribed', None)
+        if is_subscribed is not None:
+            return is_subscribed
+        return obj.id in get_following_ids(request)
 
 
 class FollowReadSerializer(UserSerializer):
     '''Сериализатор для чтения объектов модели Follow.'''
 
     recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.SerializerMethodField()
 
     class Meta:
         model = User
         fields = UserSerializer.Meta.fields + [
-            'recipes', 'recipes_count'
+            'recipes', 'recipes_count', 'followers_count'
         ]
 
     def get_recipes(self, obj):
-        try:
-            recipe_limit = int(
-                self.context.get('request').GET.get('recipes_limit')
-            )
-        except (TypeError, ValueError):
-            recipe_limit = None
-        return SimpleRecipeSerializer(
-            Recipe.objects.select_related(
-                'author'
-            ).prefetch_related('ingredients').filter(
-                author=obj
-            ),
-            many=True
-        ).data[:recipe_limit]
-
-    def get_recipes_count(self, obj):
-        return (
-            Recipe.objects.select_related(
-                'author'
-            ).prefetch_related('ingredients').filter(
-                author=obj
-            ).count()
-        )
+        recipes = getattr(obj, 'recipes_preview', None)
+        if recipes is None:
+            recipes = obj.recipes.all()[
+                :get_recipes_limit(self.context.get('request'))
+            ]
+        return SimpleRecipeSerializer(recipes, many=True).data
 
 
 class FollowSerializer(serializers.ModelSerializer):
@@ -177,6 +191,9 @@ class FollowSerializer(serializers.ModelSerializer):
         return super().validate(data)
 
     def to_representation(self, instance):
+        instance.following.refresh_from_db(
+            fields=('recipes_count', 'followers_count')
+        )
         return FollowReadSerializer(
             instance.following,
             context={'request': self.context.get('request')}
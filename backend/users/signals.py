@@ -0,0 +1,33 @@
+from django.conf import settings
+from django.db.models.signals import post_save, pre_save
+from django.dispatch import receiver
+
+from api.counters import change_counter
+from users.authentication import TOKEN_USER_FIELDS, revoke_user_tokens
+from users.models import Follow, User
+
+
+@receiver(post_save, sender=Follow)
+def increase_followers_count(sender, instance, created, **kwargs):
+    '''Увеличивает счётчик подписчиков автора.'''
+    if created:
+        change_counter(User, instance.following_id, 'followers_count', 1)
+
+
+@receiver(pre_save, sender=User)
+def revoke_tokens_on_credentials_change(sender, instance, update_fields,
+                                        **kwargs):
+    '''
+    Отзывает подписанные токены пользователя при смене пароля,
+    деактивации или изменении прав.
+    '''
+    fields = ('password', 'is_active') + TOKEN_USER_FIELDS
+    if (
+        settings.AUTH_MODE != 'jwt'
+        or instance._state.adding
+        or update_fields is not None and not set(fields) & set(update_fields)
+    ):
+        return
+    saved = User.objects.filter(id=instance.id).values_list(*fields).first()
+    if saved != tuple(getattr(instance, field) for field in fields):
+        revoke_user_tokens(instance.id)
@@ -0,0 +1,89 @@
+from rest_framework.throttling import SimpleRateThrottle
+
+
+class FailedLoginThrottle(SimpleRateThrottle):
+    '''
+    Ограничение числа неудачных попыток входа в скользящем окне.
+
+    Попытки считаются счётчиками в кэше по интервалам длиной в окно.
+    Число попыток за последнее окно оценивается как значение счётчика
+    текущего интервала плюс доля предыдущего, пропорциональная
+    не истёкшей части окна. Счётчики изменяются атомарными cache.add
+    и cache.incr, поэтому параллельные попытки не теряются.
+    В отличие от SimpleRateThrottle, allow_request только проверяет
+    счётчики, а попытка записывается методом record_failure после
+    неверного пароля, поэтому успешные входы лимит не расходуют.
+    '''
+
+    def get_ident_value(self, request):
+        raise NotImplementedError
+
+    def get_cache_key(self, request, view):
+        ident = self.get_ident_value(request)
+        if not ident:
+            return None
+        return self.cache_format % {'scope': self.scope, 'ident': ident}
+
+    def get_window_key(self, window):
+        return f'{self.key}:{window}'
+
+    def get_attempts(self):
+        window, elapsed = divmod(self.now, self.duration)
+        window = int(window)
+        counts = self.cache.get_many([
+            self.get_window_key(window), self.get_window_key(window - 1)
+        ])
+        return (
+            counts.get(self.get_window_key(window), 0)
+            + counts.get(self.get_window_key(window - 1), 0)
+            * (1 - elapsed / self.duration)
+        )
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+        self.now = self.timer()
+        if self.get_attempts() >= self.num_requests:
+            return self.throttle_failure()
+        return True
+
+    def wait(self):
+        return self.duration - self.now % self.duration
+
+    def record_failure(self, request, view):
+        '''Увеличивает счётчик неудачных попыток текущего интервала.'''
+        if self.rate is None:
+            return
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return
+        key = self.get_window_key(int(self.timer() // self.duration))
+        self.cache.add(key, 0, 2 * self.duration)
+        try:
+            self.cache.incr(key)
+        except ValueError:
+            self.cache.add(key, 1, 2 * self.duration)
+
+
+class LoginIPThrottle(FailedLoginThrottle):
+    '''Неудачные попытки входа с одного IP-адреса.'''
+
+    scope = 'login_ip'
+
+    def get_ident_value(self, request):
+        return self.get_ident(request)
+
+
+class LoginEmailThrottle(FailedLoginThrottle):
+    '''Неудачные попытки входа в одну учётную запись.'''
+
+    scope = 'login_email'
+
+    def get_ident_value(self, request):
+        email = request.data.get('email')
+        if not isinstance(email, str):
+            return None
+        return email.strip().lower()
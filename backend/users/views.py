@@ -1,12 +1,34 @@
+from collections import defaultdict
+
+from django.contrib.auth.signals import user_logged_in
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Prefetch, Value
 from django.shortcuts import get_object_or_404
-from djoser.views import UserViewSet
+from djoser.utils import logout_user
+from djoser.views import TokenCreateView, UserViewSet
 from rest_framework import status
 from rest_framework.decorators import action
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.exceptions import AuthenticationFailed, ValidationError
+from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
+from rest_framework.views import APIView
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
 
+from api.counters import change_counter
+from api.models import Recipe
+from users.authentication import (TOKEN_USER_FIELDS, create_tokens, is_revoked,
+                                  revoke_token)
 from users.models import Follow, User
-from users.serializers import FollowReadSerializer, FollowSerializer
+from users.serializers import (FollowReadSerializer, FollowSerializer,
+                               get_recipes_limit)
+from users.throttling import LoginEmailThrottle, LoginIPThrottle
+
+# Поля рецепта, которые нужны для краткого отображения в подписках.
+PREVIEW_RECIPE_FIELDS = (
+    'id', 'name', 'image', 'image_renditions', 'cooking_time', 'author_id',
+    'pub_date'
+)
 
 
 class UserView(UserViewSet):
@@ -19,7 +41,22 @@ class UserView(UserViewSet):
     '''
 
     def get_queryset(self):
-        return User.objects.all()
+        queryset = User.objects.all()
+        if not self.request.user.is_authenticated:
+            return queryset
+        return queryset.annotate(
+            is_subscribed=Exists(
+                Follow.objects.filter(
+                    user=self.request.user,
+                    following=OuterRef('id')
+                )
+            )
+        )
+
+    def get_instance(self):
+        if getattr(self.request.user, 'is_stateless', False):
+            return User.objects.get(id=self.request.user.id)
+        return super().get_instance()
 
     def get_follow_queryset(self):
         return Follow.objects.select_related('author').filter(
@@ -55,18 +92,157 @@ class UserView(UserViewSet):
         if request.method == 'POST':
             serializer.save()
             return Response(serializer.data, status=status.HTTP_201_CREATED)
-        Follow.objects.get(
-            following=following,
-            user=request.user
-        ).delete()
+        with transaction.atomic():
+            deleted, _ = Follow.objects.filter(
+                following=following,
+                user=request.user
+            ).delete()
+            if deleted:
+                change_counter(User, following.id, 'followers_count', -1)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
+    def set_recipes_preview(self, authors, recipes_limit):
+        '''
+        Добавляет авторам атрибут recipes_preview с последними рецептами.
+
+        Рецепты всех авторов страницы выбираются одним запросом: строки
+        нумеруются оконной функцией ROW_NUMBER в разрезе автора,
+        и в выборку попадают только первые recipes_limit рецептов каждого.
+        '''
+        if not authors:
+            return
+        recipes = Recipe.objects.raw(
+            'SELECT id, name, image, image_renditions, cooking_time,'
+            ' author_id FROM ('
+            '    SELECT id, name, image, image_renditions, cooking_time,'
+            '    author_id,'
+            '    ROW_NUMBER() OVER ('
+            '        PARTITION BY author_id ORDER BY pub_date DESC, id DESC'
+            '    ) AS row_number'
+            f'    FROM {Recipe._meta.db_table}'
+            f'    WHERE author_id IN ({", ".join(["%s"] * len(authors))})'
+            ') AS recipes WHERE row_number <= %s '
+            'ORDER BY author_id, row_number',
+            [author.id for author in authors] + [recipes_limit]
+        )
+        recipes_by_author = defaultdict(list)
+        for recipe in recipes:
+            recipes_by_author[recipe.author_id].append(recipe)
+        for author in authors:
+            author.recipes_preview = recipes_by_author[author.id]
+
     @action(['get'], detail=False)
     def subscriptions(self, request):
         '''Возвращает список подписок пользователя.'''
-        queryset = User.objects.filter(following__user=request.user)
+        queryset = User.objects.filter(
+            following__user=request.user
+        ).annotate(
+            is_subscribed=Value(True)
+        )
+        recipes_limit = get_recipes_limit(request)
+        if recipes_limit is None:
+            queryset = queryset.prefetch_related(Prefetch(
+                'recipes',
+                queryset=Recipe.objects.only(*PREVIEW_RECIPE_FIELDS)
+            ))
         pages = self.paginate_queryset(queryset)
+        if recipes_limit is None:
+            for author in pages:
+                author.recipes_preview = author.recipes.all()
+        else:
+            self.set_recipes_preview(pages, recipes_limit)
         serializer = FollowReadSerializer(
             pages, many=True, context={'request': request}
         )
         return self.get_paginated_response(serializer.data)
+
+
+def get_refresh_token(request):
+    '''Возвращает действующий refresh-токен из тела запроса или None.'''
+    try:
+        token = RefreshToken(request.data.get('refresh'))
+    except TokenError:
+        return None
+    return None if is_revoked(token) else token
+
+
+class ThrottledTokenCreateView(TokenCreateView):
+    '''
+    Выдаёт токен с ограничением неудачных попыток входа.
+
+    Неверные учётные данные записываются в историю попыток
+    по IP-адресу и по email, а после превышения лимита запросы
+    отклоняются до проверки пароля.
+    '''
+
+    throttle_classes = (LoginIPThrottle, LoginEmailThrottle)
+
+    def post(self, request, **kwargs):
+        try:
+            return super().post(request, **kwargs)
+        except ValidationError:
+            for throttle in self.get_throttles():
+                throttle.record_failure(request, self)
+            raise
+
+
+class JWTTokenCreateView(ThrottledTokenCreateView):
+    '''
+    Выдаёт пару подписанных токенов вместо ключа authtoken.
+
+    Короткоживущий токен доступа возвращается в поле auth_token,
+    как и ключ authtoken, refresh-токен - в поле refresh.
+    '''
+
+    def _action(self, serializer):
+        refresh, access = create_tokens(serializer.user)
+        user_logged_in.send(
+            sender=User, request=self.request, user=serializer.user
+        )
+        return Response(
+            {'auth_token': str(access), 'refresh': str(refresh)},
+            status=status.HTTP_200_OK
+        )
+
+
+class JWTTokenRefreshView(APIView):
+    '''
+    Выдаёт новый токен доступа по refresh-токену.
+
+    Поля пользователя в новом токене берутся из базы,
+    поэтому изменения прав попадают в токен при обновлении.
+    '''
+
+    permission_classes = (AllowAny,)
+
+    def post(self, request):
+        refresh = get_refresh_token(request)
+        user = refresh and User.objects.filter(
+            id=refresh['user_id'], is_active=True
+        ).first()
+        if not user:
+            raise AuthenticationFailed('Токен недействителен или отозван.')
+        access = refresh.access_token
+        for field in TOKEN_USER_FIELDS:
+            access[field] = getattr(user, field)
+        return Response({'auth_token': str(access)})
+
+
+class JWTTokenDestroyView(APIView):
+    '''
+    Отзывает токен доступа и переданный в теле refresh-токен.
+
+    Запросы с ключом authtoken обрабатываются как в djoser.
+    '''
+
+    permission_classes = (IsAuthenticated,)
+
+    def post(self, request):
+        if not isinstance(request.auth, AccessToken):
+            logout_user(request)
+            return Response(status=status.HTTP_204_NO_CONTENT)
+        revoke_token(request.auth)
+        refresh = get_refresh_token(request)
+        if refresh and refresh['user_id'] == request.user.id:
+            revoke_token(refresh)
+        return Response(status=status.HTTP_204_NO_CONTENT)
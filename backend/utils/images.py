@@ -0,0 +1,102 @@
+import io
+from pathlib import PurePosixPath
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps
+
+# Расширение файла уменьшенной копии: формат Pillow.
+RENDITION_FORMATS = {
+    'webp': 'WEBP',
+    'jpeg': 'JPEG',
+}
+# Параметры кодирования из image.info, не являющиеся метаданными.
+ENCODING_INFO_KEYS = {
+    'adobe', 'adobe_transform', 'aspect', 'background', 'compression',
+    'dpi', 'duration', 'gamma', 'interlace', 'jfif', 'jfif_density',
+    'jfif_unit', 'jfif_version', 'loop', 'progression', 'progressive',
+    'transparency',
+}
+
+
+def get_rendition_name(source, size_name, extension):
+    '''Возвращает путь уменьшенной копии рядом с исходным файлом.'''
+    path = PurePosixPath(source)
+    return str(
+        path.parent / 'renditions' / f'{path.stem}_{size_name}.{extension}'
+    )
+
+
+def save_image(storage, name, image, image_format, **options):
+    '''Кодирует изображение и сохраняет его в хранилище.'''
+    buffer = io.BytesIO()
+    image.save(buffer, image_format, **options)
+    return storage.save(name, ContentFile(buffer.getvalue()))
+
+
+def flatten(image):
+    '''Переводит изображение в RGB, заливая прозрачные области белым.'''
+    if image.mode == 'RGB':
+        return image
+    image = image.convert('RGBA')
+    background = Image.new('RGB', image.size, 'white')
+    background.paste(image, mask=image.getchannel('A'))
+    return background
+
+
+def create_renditions(field_file):
+    '''
+    Создаёт уменьшенные копии изображения в форматах WebP и JPEG.
+
+    Файл декодируется один раз. Если в нём есть метаданные (EXIF,
+    ICC-профиль, XMP, текстовые блоки PNG и любые другие поля image.info,
+    кроме ENCODING_INFO_KEYS), исходный файл перезаписывается без них
+    с учётом ориентации из EXIF.
+    Копии создаются по размерам IMAGE_RENDITIONS от большей к меньшей,
+    каждая из предыдущей. Возвращает словарь с путями копий и именем
+    исходного файла в ключе source.
+    '''
+    storage = field_file.storage
+    with field_file.open('rb'), Image.open(field_file) as image:
+        image_format = image.format
+        has_metadata = bool(
+            image.info.keys() - ENCODING_INFO_KEYS or image.getexif()
+        )
+        image = ImageOps.exif_transpose(image)
+        image.load()
+    image.info = {
+        key: value for key, value in image.info.items()
+        if key in ENCODING_INFO_KEYS
+    }
+    if has_metadata:
+        storage.delete(field_file.name)
+        save_image(storage, field_file.name, image, image_format, quality=95)
+    renditions = {'source': field_file.name}
+    image = flatten(image)
+    for size_name, size in sorted(
+        settings.IMAGE_RENDITIONS.items(),
+        key=lambda item: item[1],
+        reverse=True
+    ):
+        image = image.copy()
+        image.thumbnail(size, Image.Resampling.LANCZOS)
+        renditions[size_name] = {
+            extension: save_image(
+                storage,
+                get_rendition_name(field_file.name, size_name, extension),
+                image,
+                rendition_format,
+                quality=settings.IMAGE_RENDITION_QUALITY
+            )
+            for extension, rendition_format in RENDITION_FORMATS.items()
+        }
+    return renditions
+
+
+def delete_renditions(storage, renditions):
+    '''Удаляет файлы уменьшенных копий.'''
+    for size_name, paths in renditions.items():
+        if size_name == 'source':
+            continue
+        for path in paths.values():
+            storage.delete(path)
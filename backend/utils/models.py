@@ -0,0 +1,22 @@
+class CountersModelMixin:
+    '''
+    Примесь для моделей с денормализованными счётчиками.
+
+    Счётчики изменяются только запросами UPDATE с F(), поэтому значения,
+    загруженные вместе с объектом, могут устареть к моменту сохранения.
+    При обычном сохранении существующего объекта поля counter_fields
+    не записываются в базу.
+    '''
+
+    counter_fields = ()
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            deferred = self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.attname not in deferred
+                and field.name not in self.counter_fields
+            ]
+        super().save(*args, **kwargs)
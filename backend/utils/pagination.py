@@ -1,13 +1,327 @@
+import base64
+import binascii
+import hashlib
+import json
+from collections import OrderedDict
+from datetime import datetime
+
 from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.core.paginator import EmptyPage, Page, PageNotAnInteger, Paginator
+from django.db import connection
+from django.db.models import BooleanField, F, Func, Q, Value
+from django.utils.functional import cached_property
 from rest_framework import pagination
+from rest_framework.exceptions import NotFound, ParseError
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+def estimate_table_rows(model):
+    '''
+    Возвращает оценку числа строк таблицы модели по статистике Postgres.
+
+    Если оценка недоступна (другая СУБД или таблица ещё не анализировалась),
+    возвращается None.
+    '''
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT reltuples FROM pg_class WHERE oid = %s::regclass',
+            [model._meta.db_table]
+        )
+        row = cursor.fetchone()
+    if row is None or row[0] < 0:
+        return None
+    return int(row[0])
+
+
+class ApproximatePage(Page):
+    '''Страница, у которой может быть продолжение за пределами оценки.'''
+
+    def has_next(self):
+        return super().has_next() or (
+            self.paginator.count_is_approximate
+            and len(self) == self.paginator.per_page
+        )
+
+
+class CountingPaginator(Paginator):
+    '''
+    Пагинатор, выбирающий способ подсчёта объектов по размеру выборки.
+
+    Небольшие выборки считаются точно запросом COUNT по выборке,
+    ограниченной EXACT_COUNT_LIMIT строками. Для больших выборок без
+    фильтров используется оценка reltuples из статистики Postgres,
+    для отфильтрованных - точное значение, закэшированное по ключу
+    count_key на COUNT_CACHE_TIMEOUT секунд. Оценка и значение из кэша
+    считаются приблизительными: count_is_approximate = True.
+    '''
+
+    def __init__(self, object_list, per_page, *args, count_key=None,
+                 **kwargs):
+        super().__init__(object_list, per_page, *args, **kwargs)
+        self.count_key = count_key
+        self.count_is_approximate = False
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        limit = settings.PAGINATION_EXACT_COUNT_LIMIT
+        count = queryset.order_by()[:limit + 1].count()
+        if count <= limit:
+            return count
+        if not queryset.query.where:
+            estimate = estimate_table_rows(queryset.model)
+            if estimate is not None:
+                self.count_is_approximate = True
+                return max(estimate, count)
+        if self.count_key is None:
+            return queryset.count()
+        count = cache.get(self.count_key)
+        if count is not None:
+            self.count_is_approximate = True
+            return count
+        count = queryset.count()
+        cache.set(
+            self.count_key, count, settings.PAGINATION_COUNT_CACHE_TIMEOUT
+        )
+        return count
+
+    def validate_number(self, number):
+        if not self.count or not self.count_is_approximate:
+            return super().validate_number(number)
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger('Номер страницы должен быть числом.')
+        if number < 1:
+            raise EmptyPage('Номер страницы меньше 1.')
+        return number
+
+    def page(self, number):
+        number = self.validate_number(number)
+        if not self.count_is_approximate:
+            return super().page(number)
+        bottom = (number - 1) * self.per_page
+        return self._get_page(
+            self.object_list[bottom:bottom + self.per_page], number, self
+        )
+
+    def _get_page(self, *args, **kwargs):
+        return ApproximatePage(*args, **kwargs)
+
+
+class KeysetPagination(pagination.BasePagination):
+    '''
+    Пагинация по ключу сортировки без OFFSET и подсчёта объектов.
+
+    Курсор хранит значения полей сортировки последнего объекта страницы,
+    а следующая страница выбирается условием "после этих значений",
+    поэтому время ответа не зависит от номера страницы.
+    К сортировке queryset всегда добавляется id для однозначности ключа.
+    '''
+
+    page_size = settings.PAGINATION
+    page_size_query_param = 'limit'
+    max_page_size = 50
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Некорректный курсор.'
+    invalid_ordering_message = (
+        'Пагинация по курсору недоступна для этой сортировки.'
+    )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.ordering = self.get_ordering(queryset)
+        self.validate_ordering(queryset.model)
+        queryset = queryset.order_by(*self.ordering)
+        cursor = self.decode_cursor(request, queryset.model)
+        if cursor is not None:
+            queryset = queryset.filter(self.get_keyset_filter(cursor))
+        results = list(queryset[:self.page_size + 1])
+        self.next_cursor = None
+        if len(results) > self.page_size:
+            results = results[:self.page_size]
+            self.next_cursor = self.encode_cursor(results[-1])
+        return results
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('results', data),
+        ]))
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def get_ordering(self, queryset):
+        ordering = list(
+            queryset.query.order_by or queryset.model._meta.ordering
+        )
+        if not any(field.lstrip('-') in ('id', 'pk') for field in ordering):
+            descending = bool(ordering) and ordering[0].startswith('-')
+            ordering.append('-id' if descending else 'id')
+        return ordering
+
+    def validate_ordering(self, model):
+        '''
+        Проверяет, что все поля сортировки - поля модели.
+
+        Значения аннотаций и связанных моделей нельзя сохранить
+        в курсоре и восстановить из него, поэтому такая сортировка
+        отклоняется с ошибкой 400.
+        '''
+        for field in self.ordering:
+            try:
+                if not isinstance(field, str) or '__' in field:
+                    raise FieldDoesNotExist
+                if not self.get_field(model, field).concrete:
+                    raise FieldDoesNotExist
+            except FieldDoesNotExist:
+                raise ParseError(self.invalid_ordering_message)
+
+    def get_keyset_filter(self, cursor):
+        '''
+        Строит условие "строка после курсора" для составного ключа.
+
+        Если все поля сортируются в одном направлении, условие
+        записывается сравнением строк (a, b) < (a0, b0), которое Postgres
+        использует как условие поиска по составному индексу.
+        Иначе строится a < a0 OR (a = a0 AND b < b0) с учётом направления
+        каждого поля, и к нему добавляется избыточная граница a <= a0,
+        чтобы индекс по первому полю начинал просмотр с курсора.
+        '''
+        names = [field.lstrip('-') for field in self.ordering]
+        directions = {field.startswith('-') for field in self.ordering}
+        if len(directions) == 1:
+            return Func(
+                Func(*map(F, names), function='ROW'),
+                Func(*map(Value, cursor), function='ROW'),
+                template='%(expressions)s',
+                arg_joiner=' < ' if directions.pop() else ' > ',
+                output_field=BooleanField()
+            )
+        keyset_filter = Q()
+        equal = Q()
+        for field, name, value in zip(self.ordering, names, cursor):
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            keyset_filter |= equal & Q(**{f'{name}__{lookup}': value})
+            equal &= Q(**{name: value})
+        bound = 'lte' if self.ordering[0].startswith('-') else 'gte'
+        return Q(**{f'{names[0]}__{bound}': cursor[0]}) & keyset_filter
+
+    def encode_cursor(self, obj):
+        values = []
+        for field in self.ordering:
+            value = getattr(obj, field.lstrip('-'))
+            values.append(
+                value.isoformat() if isinstance(value, datetime) else value
+            )
+        return base64.urlsafe_b64encode(
+            json.dumps(values).encode()
+        ).decode()
+
+    def decode_cursor(self, request, model):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            values = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+            if len(values) != len(self.ordering):
+                raise ValueError
+            return [
+                self.get_field(model, field).to_python(value)
+                for field, value in zip(self.ordering, values)
+            ]
+        except (
+            binascii.Error, ValueError, TypeError,
+            FieldDoesNotExist, ValidationError
+        ):
+            raise NotFound(self.invalid_cursor_message)
+
+    def get_field(self, model, field):
+        name = field.lstrip('-')
+        if name == 'pk':
+            return model._meta.pk
+        return model._meta.get_field(name)
+
+    def get_next_link(self):
+        if self.next_cursor is None:
+            return None
+        return replace_query_param(
+            self.request.build_absolute_uri(),
+            self.cursor_query_param,
+            self.next_cursor
+        )
 
 
 class PageLimitPagination(pagination.PageNumberPagination):
     '''
     Кастомная пагинация с возможностью ограничения
     количества объектов при помощи значения limit в запросе.
+
+    Количество объектов считается CountingPaginator, а поле
+    count_is_approximate ответа сообщает, является ли count оценкой.
+    Если в запросе передан параметр cursor (в том числе пустой),
+    а действие представления перечислено в его атрибуте keyset_actions,
+    используется пагинация по ключу KeysetPagination.
     '''
 
     page_size = settings.PAGINATION
     page_size_query_param = 'limit'
     max_page_size = 50
+    keyset_pagination_class = KeysetPagination
+
+    def django_paginator_class(self, object_list, per_page):
+        return CountingPaginator(
+            object_list, per_page, count_key=self.count_key
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset_paginator = None
+        if self.keyset_pagination_class.cursor_query_param in (
+            request.query_params
+        ) and getattr(view, 'action', None) in getattr(
+            view, 'keyset_actions', ()
+        ):
+            self.keyset_paginator = self.keyset_pagination_class()
+            return self.keyset_paginator.paginate_queryset(
+                queryset, request, view
+            )
+        self.count_key = self.get_count_key(request)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_count_key(self, request):
+        '''
+        Возвращает ключ кэша количества объектов для запроса.
+
+        Ключ зависит от пути, пользователя и параметров фильтрации,
+        но не от номера и размера страницы.
+        '''
+        params = sorted(
+            (key, value)
+            for key, values in request.query_params.lists()
+            if key not in (self.page_query_param, self.page_size_query_param)
+            for value in values
+        )
+        raw_key = json.dumps([request.path, request.user.id, params])
+        return f'count:{hashlib.md5(raw_key.encode()).hexdigest()}'
+
+    def get_paginated_response(self, data):
+        if self.keyset_paginator is not None:
+            return self.keyset_paginator.get_paginated_response(data)
+        response = super().get_paginated_response(data)
+        response.data['count_is_approximate'] = (
+            self.page.paginator.count_is_approximate
+        )
+        return response
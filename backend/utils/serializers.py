@@ -21,30 +21,32 @@ def validate_existing_object(value, model):
         )
 
 
-def validate_cart_favorite(request, data, model):
-    '''Валидация моделей Cart и Favorite
-
-    Проверяет нахождения объекта(рецепта)
-    модели(Cart или Favorite) в базе.'''
-    if request.method == 'POST':
-        if model.objects.filter(
-                author=data.get('author'),
-                recipe=data.get('recipe').id
-        ).exists():
-            return raise_validation_error(
-                'Нельзя добавить дважды один и тот же объект'
-            )
-        return data
-    try:
-        model.objects.get(
-            recipe=data.get('recipe'),
-            author=data.get('author')
-        )
-    except model.DoesNotExist:
-        return raise_validation_error(
-            f'Не существует такого объекта модели {model.__name__}'
-        )
-    return data
+class ImageRenditionsField(serializers.ReadOnlyField):
+    '''
+    Поле со ссылками на уменьшенные копии картинки рецепта.
+
+    Возвращает словарь вида {размер: {формат: ссылка}}. Если в контексте
+    есть запрос, ссылки абсолютные, как у поля image.
+    '''
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault('source', 'image_renditions')
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        request = self.context.get('request')
+        storage = Recipe._meta.get_field('image').storage
+        images = {}
+        for size_name, paths in value.items():
+            if size_name == 'source':
+                continue
+            images[size_name] = {}
+            for extension, path in paths.items():
+                url = storage.url(path)
+                if request is not None:
+                    url = request.build_absolute_uri(url)
+                images[size_name][extension] = url
+        return images
 
 
 class SimpleRecipeSerializer(serializers.ModelSerializer):
@@ -53,6 +55,8 @@ class SimpleRecipeSerializer(serializers.ModelSerializer):
     предназначенный для отображения объектов модели в упрощенном виде.
     '''
 
+    images = ImageRenditionsField()
+
     class Meta:
         model = Recipe
-        fields = ['id', 'name', 'image', 'cooking_time']
+        fields = ['id', 'name', 'image', 'images', 'cooking_time']
@@ -0,0 +1,57 @@
+import csv
+import json
+
+
+class Echo:
+    '''Псевдобуфер, возвращающий записанную в него строку.'''
+
+    def write(self, value):
+        return value
+
+
+def render_txt(ingredients):
+    '''Построчно формирует список покупок в текстовом формате.'''
+    for ingredient in ingredients:
+        yield (
+            f'{ingredient["name"]}: '
+            f'{ingredient["amount"]}'
+            f'{ingredient["measurement_unit"]}\n'
+        )
+
+
+def render_csv(ingredients):
+    '''Построчно формирует список покупок в формате CSV.'''
+    writer = csv.writer(Echo())
+    yield writer.writerow(('name', 'measurement_unit', 'amount'))
+    for ingredient in ingredients:
+        yield writer.writerow(
+            (
+                ingredient['name'],
+                ingredient['measurement_unit'],
+                ingredient['amount']
+            )
+        )
+
+
+def render_json(ingredients):
+    '''Построчно формирует список покупок в формате JSON.'''
+    yield '['
+    separator = '\n'
+    for ingredient in ingredients:
+        yield separator + json.dumps(
+            {
+                'name': ingredient['name'],
+                'measurement_unit': ingredient['measurement_unit'],
+                'amount': ingredient['amount']
+            },
+            ensure_ascii=False
+        )
+        separator = ',\n'
+    yield '\n]\n'
+
+
+SHOPPING_LIST_FORMATS = {
+    'txt': ('text/plain', render_txt),
+    'csv': ('text/csv', render_csv),
+    'json': ('application/json', render_json),
+}